@@ -1,6 +1,8 @@
 import streamlit as st
+import hashlib
 import os
 import tempfile
+import threading
 from typing import List
 from modules.document_parser import DocumentParser
 from modules.text_processor import TextProcessor
@@ -9,6 +11,10 @@ from modules.reranker import ReRanker
 from modules.answer_merger import T5AnswerMerger
 from modules.query_pipeline import QueryPipeline
 from modules.vlm_service import VLMService
+from modules.caption_cache import CaptionCache
+from modules.embedding_cache import EmbeddingCache
+from modules.ingest_pipeline import IngestPipeline
+from modules.chunker import TokenChunker
 
 # Streamlit page setup
 st.set_page_config(page_title="📄 AI PDF Query System", layout="wide")
@@ -16,41 +22,114 @@ st.title("📄 AI PDF Query System")
 
 # Initialize components
 API_URL = "http://localhost:8000/caption_image"
+# Answers are the top retrieved passage unless T5 merging is enabled: `PDF_SEARCH_T5_MERGER=1 streamlit run app.py`
+USE_T5_MERGER = os.environ.get("PDF_SEARCH_T5_MERGER", "").lower() in ("1", "true", "yes")
 
-vlm_service = VLMService(api_url=API_URL)
-parser = DocumentParser(vlm_service)
-text_processor = TextProcessor()
-vector_db = VectorDBHandler()
-reranker = None
-t5_merger = None
 
-pipeline = QueryPipeline(text_processor, vector_db, reranker, t5_merger)
+# Streamlit re-executes this script on every interaction; everything expensive lives in
+# st.cache_resource, which is created once per process and shared by all sessions.
+@st.cache_resource
+def load_models():
+    """
+    Models and services shared by every session and every document index.
+    """
+    vlm_service = VLMService(api_url=API_URL, cache=CaptionCache("cache/captions.sqlite"))
+    text_processor = TextProcessor(cache=EmbeddingCache("cache/embeddings.sqlite"))
+    return {
+        "parser": DocumentParser(vlm_service),
+        "text_processor": text_processor,
+        "chunker": TokenChunker(text_processor.tokenizer, max_tokens=text_processor.max_seq_length),
+        "reranker": None,
+        "t5_merger": T5AnswerMerger(preset="short") if USE_T5_MERGER else None,
+        # Parsing and embedding already saturate the CPU / GPU; run one ingestion at a time
+        "ingest_lock": threading.Lock(),
+    }
 
-# File uploader
-uploaded_file = st.file_uploader("📂 Upload a PDF file", type=["pdf"])
 
-if uploaded_file:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-        temp_file.write(uploaded_file.getbuffer())
-        pdf_path = temp_file.name
+class DocumentIndex:
+    """
+    In-memory index of one uploaded PDF, filled by a background ingestion thread.
+    Batches become searchable as they are stored, so queries don't wait for the whole document.
+    """
+
+    def __init__(self, file_hash, pdf_bytes, models):
+        self.vector_db = VectorDBHandler(collection_name=f"pdf_{file_hash[:16]}",
+                                         vector_size=models["text_processor"].dimension)
+        self.pipeline = QueryPipeline(models["text_processor"], self.vector_db, models["reranker"], models["t5_merger"])
+        # Small batches make the first pages searchable early
+        self.ingest_pipeline = IngestPipeline(models["parser"], models["text_processor"], self.vector_db, batch_size=32,
+                                              chunker=models["chunker"], root=tempfile.gettempdir())
+        self.ingest_lock = models["ingest_lock"]
+        self._start_lock = threading.Lock()
+        self.thread = None
+        self.start(pdf_bytes)
+
+    def start(self, pdf_bytes):
+        """
+        Starts (or, after a failure, restarts) the background ingestion. Sessions share the index, so only
+        one ingestion thread may run at a time.
+        :return: False if an ingestion is already running.
+        """
+        with self._start_lock:
+            if self.thread is not None and (self.thread.is_alive() or self.status != "failed"):
+                return False
+            self.status = "queued"
+            self.summary = None
+            self.error = None
+            self.thread = threading.Thread(target=self._ingest, args=(pdf_bytes, self.ingest_lock), daemon=True)
+            self.thread.start()
+            return True
+
+    def _ingest(self, pdf_bytes, ingest_lock):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+            temp_file.write(pdf_bytes)
+            pdf_path = temp_file.name
+        try:
+            with ingest_lock:
+                self.status = "processing"
+                self.summary = self.ingest_pipeline.ingest_pdf(pdf_path)
+                self.ingest_pipeline.close()
+            self.status = "done"
+        except Exception as e:
+            self.error = str(e)
+            self.status = "failed"
+        finally:
+            # Delete temp file after processing
+            os.remove(pdf_path)
+
+    @property
+    def ready(self):
+        return self.status == "done"
+
+
+@st.cache_resource(max_entries=16)
+def get_document_index(file_hash, _pdf_bytes):
+    """
+    One index per distinct PDF content: re-uploads and reruns reuse it instead of re-ingesting.
+    (`_pdf_bytes` is excluded from Streamlit's cache key; the hash identifies the file.)
+    """
+    return DocumentIndex(file_hash, _pdf_bytes, load_models())
 
-    st.success("✅ PDF uploaded successfully! Processing now...")
 
-    # Parse PDF
-    with st.spinner("🔄 Extracting text and images..."):
-        structured_data = parser.parse_pdf(pdf_path)
-        text_chunks = text_processor.extract_text_items(structured_data)
-        embeddings = text_processor.embed_chunks(text_chunks)
-        vector_db.store_vectors(text_chunks, embeddings)
+# File uploader
+uploaded_file = st.file_uploader("📂 Upload a PDF file", type=["pdf"])
 
-    # Delete temp file after processing
-    os.remove(pdf_path)
+document_index = None
+if uploaded_file:
+    pdf_bytes = uploaded_file.getvalue()
+    document_index = get_document_index(hashlib.sha256(pdf_bytes).hexdigest(), pdf_bytes)
 
-    st.success("✅ Document processed and stored in Qdrant!")
-    
-    # Store structured data in session state
-    st.session_state["structured_data"] = structured_data
-    st.session_state["document_uploaded"] = True
+    if document_index.status == "failed":
+        st.error(f"⚠️ Processing failed: {document_index.error}")
+        # Parse failures are usually deterministic (e.g. a corrupt PDF), so retrying is left to the user
+        if st.button("🔄 Retry") and document_index.start(pdf_bytes):
+            st.info("🔄 Retrying... Refresh to see the progress.")
+    elif document_index.ready:
+        st.success(f"✅ Document processed and stored in Qdrant! ({document_index.summary['chunks']} chunks)")
+    else:
+        st.info("🔄 Extracting text and images in the background... "
+                "You can already search the pages processed so far.")
+        st.button("🔄 Refresh status")
 
 # Query section
 st.header("🔎 Ask a Question About the PDF")
@@ -62,17 +141,32 @@ if st.button("Search"):
     elif not query:
         st.error("⚠️ Please enter a question!")
     else:
-        with st.spinner("🔄 Searching for the best answer..."):
-            answer = pipeline.process_query(query)
+        pipeline = document_index.pipeline
+        t5_merger = pipeline.t5_merger
 
-        # Handle empty results
-        if isinstance(answer, List) and answer:
-            answer = answer[0]  # Take the top answer
-        else:
-            answer = "No relevant information found."
-
-        st.success("✅ Answer retrieved!")
+        # Show retrieved passages as soon as they are ranked, then stream the answer in
+        chunks_box = st.container()
         st.write("🔹 **Answer:**")
-        st.write(answer)
+        answer_box = st.empty()
+        answer_box.markdown("🔄 Searching for the best answer...")
+
+        streamed = ""
+        answer = None
+        for kind, payload in pipeline.stream_query(query):
+            if kind == "chunks":
+                with chunks_box.expander("📑 Retrieved passages", expanded=not t5_merger):
+                    for chunk in payload:
+                        st.markdown(f"- {chunk}")
+                answer_box.markdown("✍️ Generating answer...")
+            elif kind == "token":
+                streamed += payload
+                answer_box.markdown(streamed + "▌")
+            else:
+                answer = payload
+
+        # Handle empty results
+        if isinstance(answer, List):
+            answer = answer[0] if answer else None  # Take the top answer
+        answer_box.markdown(answer or "No relevant information found.")
 
 # Run Streamlit app with: `streamlit run app.py`
@@ -0,0 +1,113 @@
+"""
+Compares chunking strategies on a synthetic document built from the bundled sample passages:
+chunking throughput, chunk counts and sizes, and how many tokens the embedding model would
+truncate away.
+
+Strategies:
+    entries    one chunk per parsed entry (ingest without a chunker)
+    recursive  LangChain RecursiveCharacterTextSplitter over the merged document text
+    semantic   flair sentence splitting packed by characters (TextProcessor.semantic_splitter)
+    tokens     TokenChunker, packed by embedding-tokenizer tokens
+
+Usage:
+    python -m benchmarks.bench_chunkers --copies 50 --strategies entries recursive tokens
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.bench_embedding_backends import load_sample
+from modules.chunker import TokenChunker
+from modules.text_processor import TextProcessor
+
+STRATEGIES = ("entries", "recursive", "semantic", "tokens")
+
+
+def synthetic_document(passages, copies):
+    """
+    Parsed-document entries mixing short headings, normal paragraphs, long merged paragraphs and
+    image captions, in the shape DocumentParser produces.
+    """
+    content = []
+    for copy in range(copies):
+        page = copy + 1
+        content.append({"type": "text", "text": f"Section {copy}", "page": page})
+        for i, passage in enumerate(passages):
+            content.append({"type": "text", "text": passage, "page": page})
+            if i % 10 == 9:
+                # A long paragraph, well past the embedding model's input length
+                content.append({"type": "text", "text": " ".join(passages[i - 9:i + 1]), "page": page})
+                content.append({"type": "image", "index": copy, "caption": f"Figure {copy}: {passage}", "page": page})
+    return {"document": "synthetic", "content": content}
+
+
+def chunk(strategy, text_processor, chunker, structured_data):
+    if strategy == "entries":
+        return text_processor.extract_text_items(structured_data)
+    if strategy == "tokens":
+        items = list(zip(text_processor.extract_text_items(structured_data),
+                         text_processor.extract_item_metadata(structured_data)))
+        return [text for text, _ in chunker.chunk_document(items)]
+    document_text = text_processor.build_text_document(structured_data)
+    if strategy == "recursive":
+        return text_processor.chunk_text(document_text, method="recursive")
+    return text_processor.semantic_splitter(document_text)
+
+
+def bench_strategy(strategy, text_processor, chunker, structured_data, repeats):
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        chunks = chunk(strategy, text_processor, chunker, structured_data)
+        seconds.append(time.perf_counter() - start)
+
+    # Sizes in model tokens; everything past the budget is cut off by the embedding model
+    lengths = np.array(chunker.count_tokens(chunks))
+    n_entries = len(structured_data["content"])
+    n_chars = sum(len(text) for text in text_processor.extract_text_items(structured_data))
+    best = min(seconds)
+    return {
+        "strategy": strategy,
+        "seconds": round(best, 4),
+        "entries_per_second": round(n_entries / best, 1),
+        "chars_per_second": round(n_chars / best, 1),
+        "chunks": len(chunks),
+        "tokens_mean": round(float(lengths.mean()), 1),
+        "tokens_max": int(lengths.max()),
+        "over_budget_fraction": round(float(np.mean(lengths > chunker.budget)), 4),
+        "truncated_token_fraction": round(float(np.maximum(lengths - chunker.budget, 0).sum() / lengths.sum()), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunking strategy benchmark")
+    parser.add_argument("--model", type=str, default="all-MiniLM-L6-v2")
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES), choices=STRATEGIES)
+    parser.add_argument("--copies", type=int, default=20, help="Copies of the passage set in the document")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per strategy (best is reported)")
+    parser.add_argument("--overlap", type=int, default=32, help="TokenChunker overlap in tokens")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    passages, _, _ = load_sample()
+    structured_data = synthetic_document(passages, args.copies)
+    text_processor = TextProcessor(args.model)
+    chunker = TokenChunker(text_processor.tokenizer, max_tokens=text_processor.max_seq_length,
+                           overlap_tokens=args.overlap)
+
+    results = []
+    for strategy in args.strategies:
+        result = bench_strategy(strategy, text_processor, chunker, structured_data, args.repeats)
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "copies": args.copies, "max_tokens": chunker.max_tokens,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
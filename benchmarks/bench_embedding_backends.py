@@ -0,0 +1,108 @@
+"""
+Compares embedding backends (PyTorch, ONNX Runtime, int8-quantized ONNX) on query latency,
+batch throughput and retrieval quality over the bundled labelled sample set.
+
+Usage:
+    python -m benchmarks.bench_embedding_backends --backends torch onnx onnx-int8 --threads 4
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from modules.text_processor import TextProcessor
+
+SAMPLE_PATH = Path(__file__).parent / "data" / "retrieval_sample.json"
+
+
+def load_sample(path=SAMPLE_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        sample = json.load(f)
+    return sample["passages"], [q["query"] for q in sample["queries"]], [set(q["relevant"]) for q in sample["queries"]]
+
+
+def top_k_indices(query_vectors, passage_vectors, k):
+    """Exact cosine top-k, highest first."""
+    q = query_vectors / np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    p = passage_vectors / np.linalg.norm(passage_vectors, axis=1, keepdims=True)
+    return np.argsort(-(q @ p.T), axis=1)[:, :k]
+
+
+def recall_at_k(ranked, relevant):
+    return float(np.mean([len(set(row) & rel) / len(rel) for row, rel in zip(ranked.tolist(), relevant)]))
+
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def bench_backend(backend, model_name, passages, queries, threads, repeats, batch_repeat):
+    start = time.perf_counter()
+    text_processor = TextProcessor(model_name, backend=backend, num_threads=threads)
+    load_seconds = time.perf_counter() - start
+
+    for query in queries[:3]:  # warm up kernels and allocators
+        text_processor.embed_query(query)
+
+    latencies = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            text_processor.embed_query(query)
+            latencies.append(time.perf_counter() - start)
+
+    # Distinct suffixes defeat embed_chunks' de-duplication so every text is really encoded
+    batch = [f"{passage} ({i})" for i in range(batch_repeat) for passage in passages]
+    start = time.perf_counter()
+    text_processor.embed_chunks(batch)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 3),
+        "query_p50_ms": percentile_ms(latencies, 50),
+        "query_p95_ms": percentile_ms(latencies, 95),
+        "batch_texts_per_second": round(len(batch) / batch_seconds, 1),
+    }, text_processor.embed_chunks(passages), text_processor.embed_chunks(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend benchmark")
+    parser.add_argument("--model", type=str, default="all-MiniLM-L6-v2")
+    parser.add_argument("--backends", nargs="+", default=list(TextProcessor.BACKENDS), choices=TextProcessor.BACKENDS)
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads per backend")
+    parser.add_argument("--repeats", type=int, default=5, help="Passes over the query set for latency")
+    parser.add_argument("--batch_repeat", type=int, default=20, help="Copies of the passage set for throughput")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    passages, queries, relevant = load_sample()
+    results = []
+    reference_ranked = None
+
+    for backend in args.backends:
+        result, passage_vectors, query_vectors = bench_backend(
+            backend, args.model, passages, queries, args.threads, args.repeats, args.batch_repeat
+        )
+        ranked = top_k_indices(query_vectors, passage_vectors, args.k)
+        result[f"recall@{args.k}"] = round(recall_at_k(ranked, relevant), 4)
+
+        # Agreement with the first backend's top-k, i.e. how much quantization changes retrieval
+        if reference_ranked is None:
+            reference_ranked = ranked
+        result[f"overlap@{args.k}_vs_{args.backends[0]}"] = round(float(np.mean([
+            len(set(a) & set(b)) / args.k for a, b in zip(ranked.tolist(), reference_ranked.tolist())
+        ])), 4)
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "threads": args.threads, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+End-to-end offline benchmark: generates synthetic PDFs, ingests them through DocumentParser (captions
+from the local stub VLM server), TextProcessor and the vector store, then measures query latency
+percentiles and recall@k through QueryPipeline for every ranker / merger combination.
+
+Runs on CPU only; with --offline no network is used once the models are in the Hugging Face cache.
+Results are written as JSON; compare two runs with `python -m benchmarks.compare_results a.json b.json`.
+
+Usage:
+    python -m benchmarks.bench_suite --documents 6 --output results.json
+    python -m benchmarks.bench_suite --rankers cosine_similarity cross_encoder --mergers none t5 --offline
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.bench_embedding_backends import load_sample
+from benchmarks.synthetic_pdf import write_corpus
+from server.stub_vlm_server import make_server
+
+RANKERS = ("cosine_similarity", "tfidf", "cross_encoder")
+MERGERS = ("none", "concatenation", "t5")
+
+
+def start_stub_server(latency):
+    """Starts the stub caption server on a free local port; returns (server, api_url)."""
+    server = make_server(port=0, latency=latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/caption_image"
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def recall_at_k(ranked_chunks, relevant_passages, k):
+    """
+    Fraction of the relevant passages found in the top-k chunks. A passage counts as found when its
+    opening text appears in a chunk, which holds however the chunker merged or split it.
+    """
+    retrieved = [normalize(chunk) for chunk in ranked_chunks[:k]]
+    found = sum(any(normalize(passage)[:50] in chunk for chunk in retrieved) for passage in relevant_passages)
+    return found / len(relevant_passages)
+
+
+def percentiles_ms(latencies):
+    return {f"p{q}_ms": round(float(np.percentile(latencies, q)) * 1000, 3) for q in (50, 95, 99)}
+
+
+def bench_ingest(pdfs, api_url, args):
+    from modules.bm25_index import BM25Index
+    from modules.chunker import TokenChunker
+    from modules.document_parser import DocumentParser
+    from modules.ingest_pipeline import IngestPipeline
+    from modules.text_processor import TextProcessor
+    from modules.vlm_service import VLMService
+
+    class TimedDocumentParser(DocumentParser):
+        """Separates captioning time from docling time inside the parse stage."""
+        caption_seconds = 0.0
+        images = 0
+
+        def caption_images(self, images_base64, prompt="Describe this image."):
+            start = time.perf_counter()
+            results = super().caption_images(images_base64, prompt)
+            self.caption_seconds += time.perf_counter() - start
+            self.images += len(images_base64)
+            return results
+
+    # No caches: every stage does its real work
+    doc_parser = TimedDocumentParser(VLMService(api_url=api_url), image_dir=None)
+    text_processor = TextProcessor(args.model, backend=args.embedding_backend)
+    chunker = TokenChunker(text_processor.tokenizer, max_tokens=text_processor.max_seq_length)
+    if args.vector_backend == "numpy":
+        from modules.numpy_index import NumpyVectorIndex
+        vector_db = NumpyVectorIndex(vector_size=text_processor.dimension)
+    else:
+        from modules.vector_db import VectorDBHandler
+        vector_db = VectorDBHandler("bench_suite", vector_size=text_processor.dimension, recreate=True)
+    bm25_index = BM25Index()
+    ingest_pipeline = IngestPipeline(doc_parser, text_processor, vector_db, bm25_index=bm25_index, chunker=chunker)
+
+    start = time.perf_counter()
+    for pdf_path, _ in pdfs:
+        ingest_pipeline.ingest_pdf(pdf_path)
+    ingest_pipeline.close()
+    total_seconds = time.perf_counter() - start
+
+    stats = ingest_pipeline.stats
+    pages = sum(page_count for _, page_count in pdfs)
+    docling_seconds = stats["parse_seconds"] - doc_parser.caption_seconds
+    stages = {
+        "docling_parse": {"seconds": docling_seconds, "items": pages, "unit": "pages"},
+        "captioning": {"seconds": doc_parser.caption_seconds, "items": doc_parser.images, "unit": "images"},
+        "embedding": {"seconds": stats["embed_seconds"], "items": stats["chunks"], "unit": "chunks"},
+        "upsert": {"seconds": stats["store_seconds"], "items": stats["chunks"], "unit": "chunks"},
+        "total": {"seconds": total_seconds, "items": len(pdfs), "unit": "documents"},
+    }
+    for stage in stages.values():
+        stage["per_second"] = round(stage["items"] / stage["seconds"], 2) if stage["seconds"] > 0 else None
+        stage["seconds"] = round(stage["seconds"], 4)
+    return stages, text_processor, vector_db, bm25_index
+
+
+def bench_queries(text_processor, vector_db, bm25_index, passages, queries, args):
+    from modules.query_pipeline import QueryPipeline
+
+    rerankers, merger = {}, None
+    results = []
+    for retrieval in args.retrieval:
+        for ranker in args.rankers:
+            if ranker in ("tfidf", "cross_encoder") and ranker not in rerankers:
+                from modules.reranker import ReRanker
+                rerankers[ranker] = ReRanker(method=ranker)
+            for merger_method in args.mergers:
+                if merger_method == "t5" and merger is None:
+                    from modules.answer_merger import T5AnswerMerger
+                    merger = T5AnswerMerger(args.t5_model, preset=args.t5_preset)
+                pipeline = QueryPipeline(
+                    text_processor, vector_db, rerankers.get(ranker), merger,
+                    ranker_method=ranker, merger_method=None if merger_method == "none" else merger_method,
+                    top_k=args.k, bm25_index=bm25_index, retrieval_method=retrieval
+                )  # no result cache: every query is computed
+
+                recall = np.mean([
+                    recall_at_k(pipeline.retrieve_ranked(query), [passages[i] for i in relevant], args.k)
+                    for query, relevant in queries
+                ])
+                for query, _ in queries[:2]:  # warm-up
+                    pipeline.process_query(query)
+                latencies = []
+                for _ in range(args.repeats):
+                    for query, _ in queries:
+                        start = time.perf_counter()
+                        pipeline.process_query(query)
+                        latencies.append(time.perf_counter() - start)
+
+                result = {"retrieval": retrieval, "ranker": ranker, "merger": merger_method,
+                          **percentiles_ms(latencies), f"recall@{args.k}": round(float(recall), 4),
+                          "queries": len(latencies)}
+                results.append(result)
+                print(json.dumps(result))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingest and query benchmark suite")
+    parser.add_argument("--documents", type=int, default=6, help="Synthetic PDFs to generate")
+    parser.add_argument("--images", type=int, default=2, help="Images per PDF")
+    parser.add_argument("--caption_latency", type=float, default=0.05, help="Stub VLM seconds per caption")
+    parser.add_argument("--model", type=str, default="all-MiniLM-L6-v2", help="Embedding model")
+    parser.add_argument("--embedding_backend", type=str, choices=["torch", "onnx", "onnx-int8"], default="torch")
+    parser.add_argument("--vector_backend", type=str, choices=["qdrant", "numpy"], default="qdrant")
+    parser.add_argument("--retrieval", nargs="+", default=["dense"], choices=["dense", "hybrid"])
+    parser.add_argument("--rankers", nargs="+", default=list(RANKERS), choices=RANKERS)
+    parser.add_argument("--mergers", nargs="+", default=list(MERGERS), choices=MERGERS)
+    parser.add_argument("--t5_model", type=str, default="google/flan-t5-small", help="Merger model (small for CPU)")
+    parser.add_argument("--t5_preset", type=str, choices=["greedy", "short", "beam"], default="short")
+    parser.add_argument("--k", type=int, default=3, help="top_k of the query pipeline and recall@k")
+    parser.add_argument("--repeats", type=int, default=3, help="Passes over the query set for latency")
+    parser.add_argument("--offline", action="store_true", help="Use only locally cached Hugging Face models")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    if args.offline:
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+    passages, query_texts, relevant = load_sample()
+    queries = list(zip(query_texts, relevant))
+
+    server, api_url = start_stub_server(args.caption_latency)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            pdfs = write_corpus(tmp, passages, args.documents, args.images)
+            ingest, text_processor, vector_db, bm25_index = bench_ingest(pdfs, api_url, args)
+        for stage, result in ingest.items():
+            print(json.dumps({"stage": stage, **result}))
+        query = bench_queries(text_processor, vector_db, bm25_index, passages, queries, args)
+    finally:
+        server.shutdown()
+
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "config": vars(args),
+            },
+            "ingest": ingest,
+            "query": query,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Compares the Qdrant-backed VectorDBHandler with the NumPy index (exact and IVF) on synthetic
+clustered embeddings: insert time, query latency percentiles, recall@k against exact search,
+and cold-start time of a saved NumPy index.
+
+Usage:
+    python -m benchmarks.bench_vector_backends --points 50000 --dim 384 --queries 200
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from modules.numpy_index import NumpyVectorIndex
+
+
+def synthetic_embeddings(points, dim, clusters, queries, seed=0):
+    """Gaussian blobs on the unit sphere, roughly how sentence embeddings of a corpus are distributed."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=points + queries)
+    vectors = centers[labels] + 0.35 * rng.normal(size=(points + queries, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors[:points], vectors[points:]
+
+
+def timed_queries(index, query_vectors, k):
+    latencies, results = [], []
+    for query_vector in query_vectors:
+        start = time.perf_counter()
+        hits = index.search_by_vector(query_vector, k)
+        latencies.append(time.perf_counter() - start)
+        results.append([text for text, _ in hits])
+    return latencies, results
+
+
+def summarize(name, insert_seconds, latencies, results, reference, k):
+    recall = np.mean([len(set(r) & set(ref)) / k for r, ref in zip(results, reference)]) if reference else 1.0
+    return {
+        "backend": name,
+        "insert_seconds": round(insert_seconds, 3),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        f"recall@{k}_vs_exact": round(float(recall), 4),
+    }
+
+
+def bench_index(name, index, chunks, vectors, query_vectors, k, reference, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, len(chunks), batch_size):
+        index.store_vectors(chunks[offset:offset + batch_size], vectors[offset:offset + batch_size],
+                            document_id="bench", start_index=offset)
+    insert_seconds = time.perf_counter() - start
+    index.search_by_vector(query_vectors[0], k)  # warm-up (also trains IVF)
+    latencies, results = timed_queries(index, query_vectors, k)
+    return summarize(name, insert_seconds, latencies, results, reference, k), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector backend benchmark")
+    parser.add_argument("--points", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument("--skip_qdrant", action="store_true")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    vectors, query_vectors = synthetic_embeddings(args.points, args.dim, args.clusters, args.queries)
+    chunks = [f"chunk {i}" for i in range(args.points)]
+    results = []
+
+    exact = NumpyVectorIndex(vector_size=args.dim, ivf_threshold=float("inf"))
+    summary, reference = bench_index("numpy-exact", exact, chunks, vectors, query_vectors, args.k, None, args.batch_size)
+    results.append(summary)
+
+    ivf = NumpyVectorIndex(vector_size=args.dim, ivf_threshold=0, nprobe=args.nprobe)
+    results.append(bench_index("numpy-ivf", ivf, chunks, vectors, query_vectors, args.k, reference, args.batch_size)[0])
+
+    # Cold start: reopen the saved exact index through np.memmap
+    with tempfile.TemporaryDirectory() as tmp:
+        exact.path = Path(tmp)
+        exact.save()
+        start = time.perf_counter()
+        reopened = NumpyVectorIndex(path=tmp, vector_size=args.dim, ivf_threshold=float("inf"))
+        load_seconds = time.perf_counter() - start
+        reopened.search_by_vector(query_vectors[0], args.k)
+        results[0]["load_seconds"] = round(load_seconds, 4)
+        del reopened
+
+    if not args.skip_qdrant:
+        from modules.vector_db import VectorDBHandler
+        qdrant = VectorDBHandler("bench", vector_size=args.dim, recreate=True)
+        results.append(bench_index("qdrant-memory", qdrant, chunks, vectors, query_vectors, args.k, reference,
+                                   args.batch_size)[0])
+
+    for result in results:
+        print(json.dumps(result))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
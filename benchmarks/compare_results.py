@@ -0,0 +1,87 @@
+"""
+Compares two `bench_suite` result files metric by metric and flags regressions.
+
+Usage:
+    python -m benchmarks.compare_results baseline.json candidate.json --threshold 10 --fail_on_regression
+"""
+import argparse
+import json
+import sys
+
+# Metric name fragments and whether larger values are better
+HIGHER_IS_BETTER = ("per_second", "recall")
+LOWER_IS_BETTER = ("seconds", "_ms")
+
+
+def flatten(report):
+    """
+    Maps "ingest/<stage>/<metric>" and "query/<retrieval>/<ranker>/<merger>/<metric>" to numeric values.
+    """
+    metrics = {}
+    for stage, result in report.get("ingest", {}).items():
+        for name, value in result.items():
+            if isinstance(value, (int, float)) and name != "items":
+                metrics[f"ingest/{stage}/{name}"] = value
+    for result in report.get("query", []):
+        prefix = f"query/{result['retrieval']}/{result['ranker']}/{result['merger']}"
+        for name, value in result.items():
+            if isinstance(value, (int, float)) and name != "queries":
+                metrics[f"{prefix}/{name}"] = value
+    return metrics
+
+
+def direction(metric):
+    """+1 when larger is better, -1 when smaller is better, 0 when unknown."""
+    name = metric.rsplit("/", 1)[-1]
+    if any(fragment in name for fragment in HIGHER_IS_BETTER):
+        return 1
+    if any(fragment in name for fragment in LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(baseline, candidate, threshold):
+    """
+    :return: List of rows (metric, baseline, candidate, change %, verdict) for metrics in both runs.
+    """
+    rows = []
+    for metric in sorted(baseline.keys() & candidate.keys()):
+        old, new = baseline[metric], candidate[metric]
+        change = (new - old) / abs(old) * 100 if old else (0.0 if new == old else float("inf"))
+        better = direction(metric) * change
+        verdict = "regressed" if better < -threshold else "improved" if better > threshold else ""
+        rows.append((metric, old, new, change, verdict))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark suite result files")
+    parser.add_argument("baseline", type=str)
+    parser.add_argument("candidate", type=str)
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent change reported as a difference")
+    parser.add_argument("--fail_on_regression", action="store_true", help="Exit with status 1 on any regression")
+    parser.add_argument("--json", action="store_true", help="Print rows as JSON lines instead of a table")
+    args = parser.parse_args()
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, "r", encoding="utf-8") as f:
+        candidate = json.load(f)
+
+    rows = compare(flatten(baseline), flatten(candidate), args.threshold)
+    if args.json:
+        for metric, old, new, change, verdict in rows:
+            print(json.dumps({"metric": metric, "baseline": old, "candidate": new,
+                              "change_percent": round(change, 2), "verdict": verdict}))
+    else:
+        print(f"baseline:  {baseline.get('meta', {}).get('commit')}\ncandidate: {candidate.get('meta', {}).get('commit')}\n")
+        width = max((len(row[0]) for row in rows), default=10)
+        for metric, old, new, change, verdict in rows:
+            print(f"{metric:<{width}}  {old:>12.4g}  {new:>12.4g}  {change:>+8.1f}%  {verdict}")
+
+    if args.fail_on_regression and any(row[4] == "regressed" for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
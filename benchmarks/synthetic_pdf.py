@@ -0,0 +1,204 @@
+"""
+Writes small, deterministic PDFs with headings, paragraphs, ruled tables and raster images using
+only the standard library, so benchmarks need no PDF toolkit and produce the same files every run.
+
+Usage:
+    python -m benchmarks.synthetic_pdf out_dir --documents 5
+"""
+import argparse
+import random
+import textwrap
+import zlib
+from pathlib import Path
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US Letter, in points
+MARGIN = 72
+LINE_CHARS = 90  # Helvetica 10pt fits about this many characters in the text width
+
+
+def _escape(text):
+    text = text.encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _image_pixels(width, height, seed):
+    """Raw RGB bytes of a smooth random pattern: colour gradients plus a few solid rectangles."""
+    rng = random.Random(seed)
+    base = [rng.randrange(256) for _ in range(3)]
+    step = [rng.randrange(1, 4) for _ in range(3)]
+    boxes = [(rng.randrange(width), rng.randrange(height), rng.randrange(8, width // 2),
+              rng.randrange(8, height // 2), bytes(rng.randrange(256) for _ in range(3))) for _ in range(4)]
+    rows = bytearray()
+    for y in range(height):
+        for x in range(width):
+            pixel = bytes((base[c] + step[c] * (x + y)) % 256 for c in range(3))
+            for bx, by, bw, bh, colour in boxes:
+                if bx <= x < bx + bw and by <= y < by + bh:
+                    pixel = colour
+            rows += pixel
+    return bytes(rows)
+
+
+class _PageLayout:
+    """Flows blocks top to bottom, starting a new page when the next block does not fit."""
+
+    def __init__(self):
+        self.pages = []  # (content stream commands, {image name: (width, height, pixels)})
+        self._new_page()
+
+    def _new_page(self):
+        self.commands, self.images = [], {}
+        self.pages.append((self.commands, self.images))
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def _reserve(self, height):
+        if self.y - height < MARGIN and self.y < PAGE_HEIGHT - MARGIN:
+            self._new_page()
+        self.y -= height
+
+    def text_line(self, text, size=10, font="F1", x=MARGIN):
+        self._reserve(size + 4)
+        self.commands.append(f"BT /{font} {size} Tf {x} {self.y} Td ({_escape(text)}) Tj ET")
+
+    def heading(self, text):
+        self._reserve(10)
+        self.text_line(text, size=14, font="F2")
+
+    def paragraph(self, text):
+        for line in textwrap.wrap(text, LINE_CHARS):
+            self.text_line(line)
+        self._reserve(8)
+
+    def table(self, rows, row_height=18):
+        col_width = (PAGE_WIDTH - 2 * MARGIN) / len(rows[0])
+        self._reserve(row_height * len(rows) + 8)
+        top = self.y + row_height * len(rows)
+        for r, row in enumerate(rows):
+            y = top - (r + 1) * row_height
+            font = "F2" if r == 0 else "F1"
+            for c, cell in enumerate(row):
+                x = MARGIN + c * col_width
+                self.commands.append(f"{x:.1f} {y} {col_width:.1f} {row_height} re S")
+                self.commands.append(f"BT /{font} 9 Tf {x + 4:.1f} {y + 5} Td ({_escape(str(cell))}) Tj ET")
+        self._reserve(8)
+
+    def image(self, width, height, seed, scale=2):
+        self._reserve(height * scale + 8)
+        name = f"Im{len(self.images) + 1}"
+        self.images[name] = (width, height, _image_pixels(width, height, seed))
+        self.commands.append(f"q {width * scale} 0 0 {height * scale} {MARGIN} {self.y} cm /{name} Do Q")
+
+
+def write_pdf(path, blocks):
+    """
+    Writes a PDF from a list of blocks:
+      ("heading", text), ("paragraph", text), ("table", rows incl. header row), ("image", (width, height, seed)).
+    :return: Number of pages written.
+    """
+    layout = _PageLayout()
+    for kind, value in blocks:
+        if kind == "image":
+            layout.image(*value)
+        else:
+            getattr(layout, kind)(value)
+
+    objects = []  # object bodies (bytes); object number = index + 1
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_id = add(None)
+    regular = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    bold = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >>")
+
+    page_ids = []
+    for commands, images in layout.pages:
+        xobjects = []
+        for name, (width, height, pixels) in images.items():
+            data = zlib.compress(pixels)
+            image_id = add(
+                f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceRGB "
+                f"/BitsPerComponent 8 /Filter /FlateDecode /Length {len(data)} >>\nstream\n".encode() + data
+                + b"\nendstream"
+            )
+            xobjects.append(f"/{name} {image_id} 0 R")
+        stream = zlib.compress("\n".join(commands).encode("latin-1"))
+        content_id = add(f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode() + stream
+                         + b"\nendstream")
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 {regular} 0 R /F2 {bold} 0 R >> /XObject << {' '.join(xobjects)} >> >> "
+            f"/Contents {content_id} 0 R >>".encode()
+        ))
+
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode()
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[pages_id - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+
+    Path(path).write_bytes(bytes(out))
+    return len(layout.pages)
+
+
+def corpus_blocks(passages, documents, images_per_document=2, seed=0):
+    """
+    Spreads `passages` round-robin over `documents` documents, adding a spec table and images to each.
+    :return: List of block lists, one per document.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for d in range(documents):
+        blocks = [("heading", f"Synthetic report {d + 1}")]
+        for i, passage in enumerate(passages[d::documents]):
+            if i % 4 == 0:
+                blocks.append(("heading", f"Section {i // 4 + 1}"))
+            blocks.append(("paragraph", passage))
+        blocks.append(("table", [["Part", "Voltage", "Weight (kg)", "Stock"]] + [
+            [f"PX-{rng.randrange(100, 999)}", f"{rng.choice((12, 24, 48))} V", f"{rng.uniform(0.5, 20):.1f}",
+             str(rng.randrange(0, 500))] for _ in range(5)
+        ]))
+        for j in range(images_per_document):
+            blocks.append(("image", (96, 64, seed * 1000 + d * 10 + j)))
+            blocks.append(("paragraph", f"Figure {j + 1}: illustration {d + 1}.{j + 1}."))
+        corpus.append(blocks)
+    return corpus
+
+
+def write_corpus(out_dir, passages, documents, images_per_document=2, seed=0):
+    """
+    Writes `documents` PDFs into `out_dir`.
+    :return: List of (pdf path, page count).
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for d, blocks in enumerate(corpus_blocks(passages, documents, images_per_document, seed)):
+        path = out_dir / f"synthetic_{d + 1:03d}.pdf"
+        written.append((path, write_pdf(path, blocks)))
+    return written
+
+
+if __name__ == "__main__":
+    from benchmarks.bench_embedding_backends import load_sample
+
+    parser = argparse.ArgumentParser(description="Synthetic PDF corpus generator")
+    parser.add_argument("out_dir", type=str)
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--images", type=int, default=2, help="Images per document")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    passages, _, _ = load_sample()
+    for path, pages in write_corpus(args.out_dir, passages, args.documents, args.images, args.seed):
+        print(f"{path} ({pages} pages)")
@@ -0,0 +1,318 @@
+"""
+Bulk ingestion CLI: parses many PDFs in a process pool and streams them into the vector database.
+
+Usage:
+    python ingest.py path/to/pdfs "reports/**/*.pdf" --db_path qdrant_data --workers 8
+"""
+import argparse
+import atexit
+import glob
+import multiprocessing as mp
+import os
+import queue
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from modules import instrumentation
+
+API_URL = "http://localhost:8000/caption_image"
+
+# Per-process parser, created once by `_init_worker` (docling models are expensive to load)
+_worker_parser = None
+
+ENTRIES_PER_MESSAGE = 32  # entries sent to the main process per queue message
+MESSAGES_PER_DOCUMENT = 32  # queue bound per document: a worker this far ahead of embedding pauses
+
+
+def _init_worker(api_url, caption_cache_path, max_concurrent_captions, image_dir, metrics, tracing):
+    global _worker_parser
+    from modules.caption_cache import CaptionCache
+    from modules.document_parser import DocumentParser
+    from modules.vlm_service import VLMService
+
+    cache = CaptionCache(caption_cache_path) if caption_cache_path else None
+    if metrics:
+        # Each worker records into its own registry; snapshots are merged by the main process
+        instrumentation.enable(tracing=tracing)
+        instrumentation.registry.register_cache("caption", cache)
+    _worker_parser = DocumentParser(VLMService(api_url=api_url, cache=cache), max_concurrent_captions, image_dir=image_dir)
+
+
+def _parse_in_worker(pdf_path, entry_queue):
+    """
+    Parses one PDF inside a pool worker, streaming its entries to the main process through the document's
+    own bounded queue as they are produced. Puts (entries, None) messages, then a final
+    (None, (parse seconds, error message or None, metrics snapshot or None)).
+    """
+    start = time.perf_counter()
+    error = None
+    entries = []
+    try:
+        for entry in _worker_parser.iter_elements(pdf_path):
+            entries.append(entry)
+            if len(entries) >= ENTRIES_PER_MESSAGE:
+                entry_queue.put((entries, None))
+                entries = []
+        if entries:
+            entry_queue.put((entries, None))
+    except Exception as e:  # one broken PDF must not abort the whole run
+        error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    snapshot = None
+    if instrumentation.is_enabled():
+        instrumentation.registry.observe("parse_pdf", seconds, error=error is not None)
+        snapshot = instrumentation.registry.snapshot(reset=True)  # only what this document recorded
+    entry_queue.put((None, (seconds, error, snapshot)))
+
+
+class WorkerError(Exception):
+    """A pool worker failed to parse a PDF."""
+
+
+class _DocumentStream:
+    """
+    Entries of one PDF in document order, read from the queue its pool worker streams them through,
+    so the main process embeds a document while it is still being parsed.
+    """
+
+    def __init__(self, entry_queue, future):
+        self.queue = entry_queue
+        self.future = future  # only watched for a worker that died without reporting
+        self.parse_seconds = 0.0
+
+    def _get(self):
+        while True:
+            try:
+                return self.queue.get(timeout=1.0)
+            except queue.Empty:
+                if self.future.done() and self.future.exception() is not None:
+                    raise self.future.exception()  # e.g. BrokenProcessPool
+
+    def __iter__(self):
+        """Yields the entries; raises WorkerError if the worker failed to parse the PDF."""
+        while True:
+            entries, end = self._get()
+            if end is not None:
+                seconds, error, snapshot = end
+                self.parse_seconds = seconds
+                if snapshot is not None:
+                    instrumentation.registry.merge(snapshot)
+                if error:
+                    raise WorkerError(error)
+                return
+            yield from entries
+
+
+def collect_pdfs(inputs):
+    """
+    Expands directories (recursively), glob patterns and plain file paths into a sorted list of PDFs.
+    """
+    pdfs = set()
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            pdfs.update(p for p in path.rglob("*") if p.suffix.lower() == ".pdf")
+        elif glob.has_magic(item):
+            pdfs.update(Path(p) for p in glob.glob(item, recursive=True) if p.lower().endswith(".pdf"))
+        elif path.is_file():
+            pdfs.add(path)
+        else:
+            print(f"⚠️ Skipping missing input: {item}")
+    return sorted(str(p) for p in pdfs)
+
+
+def rate(count, seconds):
+    return f"{count / seconds:.2f}/s" if seconds > 0 else "n/a"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk PDF ingestion into Qdrant")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Parser processes (default: CPU count)")
+    parser.add_argument("--threads_per_worker", type=int, default=1,
+                        help="Torch/OpenMP threads per parser process (default: 1)")
+    parser.add_argument("--db_path", type=str, default="qdrant_data", help="Persistent Qdrant storage directory")
+    parser.add_argument("--db_url", type=str, default=None, help="URL of a Qdrant server (overrides --db_path)")
+    parser.add_argument("--collection", type=str, default="pdf_queries", help="Qdrant collection name")
+    parser.add_argument("--vector_backend", type=str, choices=["qdrant", "numpy"], default="qdrant",
+                        help="Vector store: Qdrant, or the in-process NumPy index saved under --db_path (default: qdrant)")
+    parser.add_argument("--quantization", type=str, choices=["none", "scalar", "binary"], default="none",
+                        help="Vector quantization for new collections (default: none)")
+    parser.add_argument("--hnsw_m", type=int, default=None, help="HNSW graph degree for new collections")
+    parser.add_argument("--hnsw_ef_construct", type=int, default=None, help="HNSW build candidate list for new collections")
+    parser.add_argument("--search_ef", type=int, default=None, help="HNSW search candidate list size")
+    parser.add_argument("--on_disk", action="store_true", help="Keep original vectors, graph and payloads on disk")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="Ingest manifest path (default: cache/<collection>_manifest.json)")
+    parser.add_argument("--bm25_index", type=str, default=None,
+                        help="BM25 index file kept in sync for hybrid retrieval (default: cache/<collection>_bm25.sqlite), "
+                             "or 'none' to disable")
+    parser.add_argument("--caption_cache", type=str, default="cache/captions.sqlite",
+                        help="SQLite caption cache path, or 'none' to disable")
+    parser.add_argument("--embedding_cache", type=str, default="cache/embeddings.sqlite",
+                        help="SQLite embedding cache path, or 'none' to disable")
+    parser.add_argument("--vlm_url", type=str, default=API_URL, help="VLM captioning endpoint")
+    parser.add_argument("--max_concurrent_captions", type=int, default=8, help="Caption requests in flight per worker")
+    parser.add_argument("--image_dir", type=str, default="output",
+                        help="Where extracted pictures are stored by content hash, or 'none' to skip writing them")
+    parser.add_argument("--chunking", type=str, choices=["tokens", "none"], default="tokens",
+                        help="Pack parsed entries into embedding-model-sized chunks, or embed each entry as is (default: tokens)")
+    parser.add_argument("--chunk_tokens", type=int, default=None,
+                        help="Tokens per chunk (default: the embedding model's max sequence length)")
+    parser.add_argument("--chunk_overlap", type=int, default=32, help="Tokens of overlap between chunks (default: 32)")
+    parser.add_argument("--root", type=str, default=None,
+                        help="Directory document ids are relative to (default: the working directory)")
+    parser.add_argument("--save_every", type=int, default=16,
+                        help="Documents between checkpoints of the indexes and the manifest (default: 16)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Record per-stage latency, throughput and cache metrics (main process and workers)")
+    parser.add_argument("--metrics_port", type=int, default=None,
+                        help="Serve /metrics (Prometheus text) and /metrics.json on this port (implies --metrics)")
+    parser.add_argument("--metrics_dump", type=str, default=None,
+                        help="Write the metrics as JSON to this path on exit (implies --metrics)")
+    parser.add_argument("--trace", action="store_true",
+                        help="Also emit OpenTelemetry spans per stage (needs opentelemetry-api; implies --metrics)")
+    parser.add_argument("--force", action="store_true", help="Re-ingest PDFs even if unchanged")
+    parser.add_argument("--prune", action="store_true",
+                        help="Delete points of manifest documents that are not among the inputs")
+    args = parser.parse_args()
+
+    metrics = bool(args.metrics or args.metrics_port or args.metrics_dump or args.trace)
+    if metrics:
+        instrumentation.enable(tracing=args.trace)
+        if args.metrics_port:
+            instrumentation.serve_metrics(args.metrics_port)
+            print(f"📈 Metrics on http://localhost:{args.metrics_port}/metrics")
+        if args.metrics_dump:
+            atexit.register(instrumentation.registry.dump, args.metrics_dump)
+
+    pdfs = collect_pdfs(args.inputs)
+    print(f"📂 Found {len(pdfs)} PDFs")
+
+    # Spawned workers inherit this, keeping N processes from oversubscribing the cores
+    os.environ.setdefault("OMP_NUM_THREADS", str(args.threads_per_worker))
+
+    from modules.bm25_index import BM25Index
+    from modules.chunker import TokenChunker
+    from modules.document_parser import DocumentParser
+    from modules.embedding_cache import EmbeddingCache
+    from modules.ingest_manifest import IngestManifest
+    from modules.ingest_pipeline import IngestPipeline
+    from modules.numpy_index import NumpyVectorIndex
+    from modules.text_processor import TextProcessor
+    from modules.vector_db import VectorDBHandler
+
+    embedding_cache = EmbeddingCache(args.embedding_cache) if args.embedding_cache.lower() != "none" else None
+    instrumentation.registry.register_cache("embedding", embedding_cache)
+    text_processor = TextProcessor(cache=embedding_cache)
+    if args.vector_backend == "numpy":
+        vector_db = NumpyVectorIndex(
+            path=os.path.join(args.db_path, args.collection) if args.db_path else None,
+            vector_size=text_processor.dimension
+        )
+    else:
+        vector_db = VectorDBHandler(
+            args.collection, path=args.db_path, url=args.db_url, vector_size=text_processor.dimension,
+            quantization=args.quantization, hnsw_m=args.hnsw_m, hnsw_ef_construct=args.hnsw_ef_construct,
+            on_disk=args.on_disk, search_ef=args.search_ef
+        )
+    chunker = TokenChunker(text_processor.tokenizer, max_tokens=args.chunk_tokens or text_processor.max_seq_length,
+                           overlap_tokens=args.chunk_overlap) if args.chunking == "tokens" else None
+    manifest = IngestManifest(
+        args.manifest or f"cache/{args.collection}_manifest.json",
+        parser_version=DocumentParser.parser_version() + (f"+{chunker.config_id}" if chunker else ""),
+        embedding_model=text_processor.model_id
+    )
+    bm25_path = args.bm25_index or f"cache/{args.collection}_bm25.sqlite"
+    bm25_index = BM25Index(bm25_path) if bm25_path.lower() != "none" else None
+    ingest_pipeline = IngestPipeline(None, text_processor, vector_db, manifest, bm25_index=bm25_index, chunker=chunker,
+                                     root=args.root, save_every=args.save_every)
+
+    if args.prune:
+        removed = ingest_pipeline.remove_missing(pdfs)
+        print(f"🧹 Removed {len(removed)} documents no longer in the corpus")
+
+    # Hash and check the manifest up front so unchanged PDFs never reach the pool
+    pending = []
+    skipped = 0
+    for pdf_path in pdfs:
+        content_hash = IngestManifest.file_hash(pdf_path)
+        if not args.force and manifest.is_current(pdf_path, content_hash):
+            skipped += 1
+        else:
+            pending.append((pdf_path, content_hash))
+    print(f"⏭️ {skipped} unchanged, 🔄 {len(pending)} to ingest with {args.workers} workers")
+    if not pending:
+        return
+
+    caption_cache = args.caption_cache if args.caption_cache.lower() != "none" else None
+    hashes = dict(pending)
+    failed = 0
+    done = 0
+    start = time.perf_counter()
+
+    parse_seconds = 0.0
+    manager = mp.get_context("spawn").Manager()
+    executor = ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=mp.get_context("spawn"),  # fork is unsafe once torch has started threads
+        initializer=_init_worker,
+        initargs=(args.vlm_url, caption_cache, args.max_concurrent_captions,
+                  args.image_dir if args.image_dir.lower() != "none" else None, metrics, args.trace),
+    )
+    in_flight = deque()  # (pdf_path, entry queue, future), consumed in submission order
+
+    def submit(pdf_path):
+        # One bounded queue per document: a worker that runs ahead of embedding pauses instead of
+        # piling parsed entries up in the main process
+        entry_queue = manager.Queue(maxsize=MESSAGES_PER_DOCUMENT)
+        in_flight.append((pdf_path, entry_queue, executor.submit(_parse_in_worker, pdf_path, entry_queue)))
+
+    try:
+        # Keeps every worker busy while bounding documents in flight; one more is submitted per stored document
+        submit_queue = iter(pdf_path for pdf_path, _ in pending)
+        for pdf_path in islice(submit_queue, 2 * args.workers):
+            submit(pdf_path)
+
+        while in_flight:
+            pdf_path, entry_queue, future = in_flight.popleft()
+            stream = _DocumentStream(entry_queue, future)
+            done += 1
+            try:
+                summary = ingest_pipeline.store_elements(ingest_pipeline.document_id(pdf_path), stream,
+                                                         pdf_path, hashes[pdf_path])
+                print(f"[{done}/{len(pending)}] ✅ {summary['document']}: {summary['chunks']} chunks")
+            except WorkerError as e:
+                failed += 1
+                print(f"[{done}/{len(pending)}] ❌ {pdf_path}: {e}")
+            parse_seconds += stream.parse_seconds
+            for next_path in islice(submit_queue, 1):
+                submit(next_path)
+    except BaseException:
+        # Nothing drains the queues any more: cancel queued documents and shut the manager down first,
+        # so workers blocked on a full queue fail instead of keeping the pool shutdown waiting forever
+        executor.shutdown(wait=False, cancel_futures=True)
+        manager.shutdown()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        manager.shutdown()
+        ingest_pipeline.close()  # checkpoint what was stored, also when interrupted
+
+    wall = time.perf_counter() - start
+    stats = ingest_pipeline.stats
+    print("\n📊 Ingest summary")
+    print(f"  documents: {done - failed} ingested, {failed} failed, {skipped} skipped in {wall:.1f}s "
+          f"({rate(done - failed, wall)})")
+    print(f"  parse:  {parse_seconds:.1f}s worker time, {rate(done, parse_seconds)} per worker")
+    print(f"  embed:  {stats['embed_seconds']:.1f}s, {rate(stats['chunks'], stats['embed_seconds'])} chunks")
+    print(f"  upsert: {stats['store_seconds']:.1f}s, {rate(stats['chunks'], stats['store_seconds'])} chunks")
+    if embedding_cache is not None:
+        print(f"  embedding cache: {embedding_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
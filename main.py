@@ -1,13 +1,17 @@
 import argparse
+import atexit
+import json
 import os
+import sys
 from typing import List
-from modules.document_parser import DocumentParser
-from modules.text_processor import TextProcessor
-from modules.vector_db import VectorDBHandler
-from modules.reranker import ReRanker
-from modules.answer_merger import T5AnswerMerger
+from modules.bm25_index import BM25Index
+from modules.query_cache import QueryResultCache
 from modules.query_pipeline import QueryPipeline
-from modules.vlm_service import VLMService
+from modules.ingest_manifest import IngestManifest
+from modules.ingest_pipeline import IngestPipeline
+from modules import instrumentation
+from modules.startup import profiler
+# Model, parser and vector store modules are imported in main() only for the components selected
 
 
 API_URL = "http://localhost:8000/caption_image"
@@ -15,45 +19,198 @@ API_URL = "http://localhost:8000/caption_image"
 def main():
     # CLI argument parser
     parser = argparse.ArgumentParser(description="AI-Powered PDF Query System")
-    parser.add_argument("pdf_path", type=str, help="Path to the PDF file")
-    parser.add_argument("--ranker", type=str, choices=["tfidf", "cosine_similarity", "none"], default="cosine_similarity",
+    parser.add_argument("pdf_path", type=str, nargs="?", default=None,
+                        help="Path to the PDF file (optional when querying an existing --db_path/--db_url collection)")
+    parser.add_argument("--ranker", type=str, choices=["tfidf", "cross_encoder", "cosine_similarity", "none"], default="cosine_similarity",
                         help="Ranking method (default: cosine_similarity)")
+    parser.add_argument("--rerank_candidates", type=int, default=20,
+                        help="Candidates retrieved and scored by the cross-encoder (default: 20)")
     parser.add_argument("--merger", type=str, choices=["t5", "concatenation"], default=None,
                         help="Merging method (default: t5)")
+    parser.add_argument("--merger_preset", type=str, choices=["greedy", "short", "beam"], default="greedy",
+                        help="T5 decoding preset (default: greedy)")
+    parser.add_argument("--merger_int8", action="store_true", help="Dynamically quantize the T5 merger to int8 (CPU)")
     parser.add_argument("--top_k", type=int, default=2, help="Number of retrieved results (default: 5)")
+    parser.add_argument("--retrieval", type=str, choices=["dense", "hybrid"], default="dense",
+                        help="Dense vector search, or hybrid dense + BM25 with reciprocal rank fusion (default: dense)")
+    parser.add_argument("--bm25_index", type=str, default=None,
+                        help="BM25 index file for persistent collections (default: cache/<collection>_bm25.sqlite)")
+    parser.add_argument("--query_cache_size", type=int, default=1024,
+                        help="Cached query responses, 0 to disable (default: 1024)")
+    parser.add_argument("--query_cache_ttl", type=float, default=3600, help="Query cache entry lifetime in seconds")
+    parser.add_argument("--queries_file", type=str, default=None,
+                        help="Answer every line of this file in batch (JSONL to stdout) instead of the interactive loop")
+    parser.add_argument("--caption_cache", type=str, default="cache/captions.sqlite",
+                        help="SQLite caption cache path, or 'none' to disable (default: cache/captions.sqlite)")
+    parser.add_argument("--embedding_cache", type=str, default="cache/embeddings.sqlite",
+                        help="SQLite embedding cache path, or 'none' to disable (default: cache/embeddings.sqlite)")
+    parser.add_argument("--embedding_backend", type=str, choices=["torch", "onnx", "onnx-int8"], default="torch",
+                        help="Embedding inference backend (default: torch)")
+    parser.add_argument("--embedding_threads", type=int, default=None, help="CPU threads for embedding inference")
+    parser.add_argument("--db_path", type=str, default=None,
+                        help="Directory for persistent Qdrant storage (default: in-memory)")
+    parser.add_argument("--db_url", type=str, default=None, help="URL of a Qdrant server (overrides --db_path)")
+    parser.add_argument("--collection", type=str, default="pdf_queries", help="Qdrant collection name")
+    parser.add_argument("--vector_backend", type=str, choices=["qdrant", "numpy"], default="qdrant",
+                        help="Vector store: Qdrant, or the in-process NumPy index saved under --db_path (default: qdrant)")
+    parser.add_argument("--quantization", type=str, choices=["none", "scalar", "binary"], default="none",
+                        help="Vector quantization for new collections (default: none)")
+    parser.add_argument("--hnsw_m", type=int, default=None, help="HNSW graph degree for new collections")
+    parser.add_argument("--hnsw_ef_construct", type=int, default=None, help="HNSW build candidate list for new collections")
+    parser.add_argument("--search_ef", type=int, default=None, help="HNSW search candidate list size")
+    parser.add_argument("--on_disk", action="store_true", help="Keep original vectors, graph and payloads on disk")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="Ingest manifest path for persistent collections (default: cache/<collection>_manifest.json)")
+    parser.add_argument("--force", action="store_true", help="Re-ingest the PDF even if it is unchanged")
+    parser.add_argument("--chunking", type=str, choices=["tokens", "none"], default="tokens",
+                        help="Pack parsed entries into embedding-model-sized chunks, or embed each entry as is (default: tokens)")
+    parser.add_argument("--chunk_tokens", type=int, default=None,
+                        help="Tokens per chunk (default: the embedding model's max sequence length)")
+    parser.add_argument("--chunk_overlap", type=int, default=32, help="Tokens of overlap between chunks (default: 32)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Record per-stage latency histograms, item counts, cache hit rates and peak memory")
+    parser.add_argument("--metrics_port", type=int, default=None,
+                        help="Serve /metrics (Prometheus text) and /metrics.json on this port (implies --metrics)")
+    parser.add_argument("--metrics_dump", type=str, default=None,
+                        help="Write the metrics as JSON to this path on exit (implies --metrics)")
+    parser.add_argument("--trace", action="store_true",
+                        help="Also emit OpenTelemetry spans per stage (needs opentelemetry-api; implies --metrics)")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Load the selected models in background threads at startup instead of on first use")
+    parser.add_argument("--profile-startup", dest="profile_startup", action="store_true",
+                        help="Load every selected model and print import / load seconds per component to stderr")
 
     args = parser.parse_args()
 
+    if args.metrics or args.metrics_port or args.metrics_dump or args.trace:
+        instrumentation.enable(tracing=args.trace)
+        if args.metrics_port:
+            instrumentation.serve_metrics(args.metrics_port)
+            print(f"📈 Metrics on http://localhost:{args.metrics_port}/metrics")
+        if args.metrics_dump:
+            atexit.register(instrumentation.registry.dump, args.metrics_dump)
+
     # Initialize components
     print("🚀 Initializing components...")
-    vlm_service = VLMService(api_url=API_URL)
-    doc_parser = DocumentParser(vlm_service)
-    text_processor = TextProcessor()
-    vector_db = VectorDBHandler()
-    reranker = ReRanker() if args.ranker == "tfidf" else None
-    t5_merger = T5AnswerMerger() if args.merger == "t5" else None
+    with profiler.measure("embedding", "import"):
+        from modules.embedding_cache import EmbeddingCache
+        from modules.text_processor import TextProcessor
+    embedding_cache = EmbeddingCache(args.embedding_cache) if args.embedding_cache.lower() != "none" else None
+    text_processor = TextProcessor(cache=embedding_cache, backend=args.embedding_backend,
+                                   num_threads=args.embedding_threads)
+    reranker = None
+    if args.ranker in ("tfidf", "cross_encoder"):
+        with profiler.measure(args.ranker.replace("_", "-"), "import"):
+            from modules.reranker import ReRanker
+        reranker = ReRanker(method=args.ranker, candidate_budget=args.rerank_candidates)
+    t5_merger = None
+    if args.merger == "t5":
+        with profiler.measure("t5 merger", "import"):
+            from modules.answer_merger import T5AnswerMerger
+        t5_merger = T5AnswerMerger(preset=args.merger_preset, quantize="int8" if args.merger_int8 else None)
+
+    # The PDF parser (docling, VLM client) is only needed to ingest
+    caption_cache = None
+    doc_parser = None
+    from modules.document_parser import DocumentParser  # light; docling itself loads with the converter
+    if args.pdf_path is not None:
+        from modules.caption_cache import CaptionCache
+        from modules.vlm_service import VLMService
+        caption_cache = CaptionCache(args.caption_cache) if args.caption_cache.lower() != "none" else None
+        vlm_service = VLMService(api_url=API_URL, cache=caption_cache)
+        doc_parser = DocumentParser(vlm_service)
+
+    # Models load on first use; warming starts them now, in parallel with each other and the vector store setup
+    components = [c for c in (text_processor, reranker, t5_merger, doc_parser) if c is not None]
+    warmups = [c.warmup() for c in components] if args.warmup or args.profile_startup else []
+
+    vector_size = text_processor.dimension  # from the model's config files; the weights keep loading in the warmup
+    with profiler.measure("vector store", "import"):
+        if args.vector_backend == "numpy":
+            from modules.numpy_index import NumpyVectorIndex
+        else:
+            from modules.vector_db import VectorDBHandler
+    with profiler.measure("vector store", "load"):
+        if args.vector_backend == "numpy":
+            vector_db = NumpyVectorIndex(
+                path=os.path.join(args.db_path, args.collection) if args.db_path else None,
+                vector_size=vector_size
+            )
+        else:
+            vector_db = VectorDBHandler(
+                args.collection, path=args.db_path, url=args.db_url, vector_size=vector_size,
+                quantization=args.quantization, hnsw_m=args.hnsw_m, hnsw_ef_construct=args.hnsw_ef_construct,
+                on_disk=args.on_disk, search_ef=args.search_ef
+            )
+
+    # The chunker (tokenizer) and manifest are only needed to ingest; query-only startup skips them
+    chunker = None
+    if args.pdf_path is not None and args.chunking == "tokens":
+        from modules.chunker import TokenChunker
+        chunker = TokenChunker(text_processor.tokenizer, max_tokens=args.chunk_tokens or text_processor.max_seq_length,
+                               overlap_tokens=args.chunk_overlap)
+
+    # A manifest only makes sense when the index outlives this process
+    persistent = bool(args.db_path or args.db_url)
+    manifest = None
+    if args.pdf_path is not None and persistent:
+        manifest = IngestManifest(
+            args.manifest or f"cache/{args.collection}_manifest.json",
+            # Chunking settings change the stored points, so they are part of the pipeline version
+            parser_version=DocumentParser.parser_version() + (f"+{chunker.config_id}" if chunker else ""),
+            embedding_model=text_processor.model_id
+        )
+    # The BM25 index lives next to the manifest when the collection is persistent, in memory otherwise
+    bm25_index = BM25Index((args.bm25_index or f"cache/{args.collection}_bm25.sqlite") if persistent else None)
+    ingest_pipeline = IngestPipeline(doc_parser, text_processor, vector_db, manifest, bm25_index=bm25_index,
+                                     chunker=chunker)
+
+    result_cache = QueryResultCache(args.query_cache_size, args.query_cache_ttl) if args.query_cache_size > 0 else None
+    for name, cache in (("caption", caption_cache), ("embedding", embedding_cache), ("query_result", result_cache)):
+        instrumentation.registry.register_cache(name, cache)
 
     # Initialize QueryPipeline with configurations
     pipeline = QueryPipeline(
         text_processor, vector_db, reranker, t5_merger,
-        ranker_method=args.ranker, merger_method=args.merger, top_k=args.top_k
+        ranker_method=args.ranker, merger_method=args.merger, top_k=args.top_k,
+        bm25_index=bm25_index, retrieval_method=args.retrieval,
+        result_cache=result_cache
     )
 
-    # Parse PDF
-    print(f"📄 Parsing PDF: {args.pdf_path}")
-    if not os.path.exists(args.pdf_path):
-        print("❌ Error: PDF file not found!")
-        return
+    if args.profile_startup:
+        for thread in warmups:
+            if thread is not None:
+                thread.join()
+        print("⏱️ Startup profile:\n" + profiler.report(), file=sys.stderr)
 
-    structured_data = doc_parser.parse_pdf(args.pdf_path)
-    
+    if args.pdf_path is None:
+        if not (args.db_path or args.db_url):
+            print("❌ Error: provide a PDF file or a persistent --db_path/--db_url to query!")
+            return
+        print(f"📚 Using existing collection '{args.collection}' ({vector_db.count()} chunks)")
+    else:
+        # Parse PDF
+        print(f"📄 Parsing PDF: {args.pdf_path}")
+        if not os.path.exists(args.pdf_path):
+            print("❌ Error: PDF file not found!")
+            return
 
-    text_chunks = text_processor.extract_text_items(structured_data)
-    print(f"Text chunks: {text_chunks}")
-    embeddings = text_processor.embed_chunks(text_chunks)
-    vector_db.store_vectors(text_chunks, embeddings)
+        summary = ingest_pipeline.ingest_pdf(args.pdf_path, force=args.force)
+        ingest_pipeline.close()
+        if summary["status"] == "skipped":
+            print(f"⏭️ Unchanged since last ingest, reusing {summary['chunks']} stored chunks")
+        else:
+            print(f"✅ PDF processed and stored in Qdrant! ({summary['chunks']} chunks)")
+        if caption_cache is not None:
+            print(f"🗂️ Caption cache: {caption_cache.stats()}")
 
-    print("✅ PDF processed and stored in Qdrant!")
+    # Batch query mode
+    if args.queries_file:
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+        for query, answer in zip(queries, pipeline.process_queries(queries)):
+            print(json.dumps({"query": query, "answer": answer}, ensure_ascii=False))
+        return
 
     # Interactive query mode
     print("\n🔎 Enter queries below (type 'exit' to quit):")
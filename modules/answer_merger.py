@@ -1,42 +1,200 @@
-from transformers import T5ForConditionalGeneration, T5Tokenizer
+import threading
+
+from modules.instrumentation import instrumented
+from modules.startup import LazyResource, profiler
+# torch and transformers are imported on first use, so selecting no merger costs nothing at startup
 
 
 # Optional: I might use T5 To generate summarized coherent answers from multiple retrieved answers. 
 
+# Loaded models shared by every T5AnswerMerger in the process, keyed by (model_name, quantize)
+_MODEL_CACHE = {}
+_MODEL_CACHE_LOCK = threading.Lock()
+
+
+def load_t5(model_name, quantize=None):
+    """
+    Loads (once per process) the tokenizer and model for `model_name`.
+    :param quantize: None, or "int8" for dynamic int8 quantization of the Linear layers (CPU inference).
+    :return: (tokenizer, model) tuple.
+    """
+    key = (model_name, quantize)
+    with _MODEL_CACHE_LOCK:
+        if key not in _MODEL_CACHE:
+            with profiler.measure("t5 merger", "import"):
+                import torch
+                from transformers import AutoTokenizer, T5ForConditionalGeneration
+            with profiler.measure("t5 merger", "load"):
+                tokenizer = AutoTokenizer.from_pretrained(model_name)
+                model = T5ForConditionalGeneration.from_pretrained(model_name).eval()
+            if quantize == "int8":
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            elif quantize is not None:
+                raise NotImplementedError(f"Quantization '{quantize}' is not implemented. Use 'int8'.")
+            _MODEL_CACHE[key] = (tokenizer, model)
+        return _MODEL_CACHE[key]
+
+
 class T5AnswerMerger:
     """
     Uses T5 to generate a concise and structured answer from multiple retrieved text snippets.
     """
 
-    def __init__(self, model_name="google/flan-t5-large" ):
+    # Generation settings; greedy decoding with a short output budget is far cheaper than beam search
+    DECODING_PRESETS = {
+        "greedy": {"num_beams": 1, "do_sample": False, "max_new_tokens": 128},
+        "short": {"num_beams": 1, "do_sample": False, "max_new_tokens": 48},
+        "beam": {"num_beams": 4, "do_sample": False, "max_new_tokens": 200, "early_stopping": True},
+    }
+
+    def __init__(self, model_name="google/flan-t5-large", max_input_tokens=512, preset="greedy", quantize=None):
         """
         Initializes the T5 transformer model.
         :param model_name: Pre-trained model
+        :param max_input_tokens: Prompt token budget; T5 was trained on 512-token inputs and degrades past it.
+        :param preset: Default decoding preset ("greedy", "short" or "beam").
+        :param quantize: None, or "int8" for dynamic quantization on CPU.
         """
         # model_name = "google/flan-t5-large" 
-        self.tokenizer = T5Tokenizer.from_pretrained(model_name)
-        self.model = T5ForConditionalGeneration.from_pretrained(model_name)
+        self._model = LazyResource(lambda: load_t5(model_name, quantize))
+        self.max_input_tokens = max_input_tokens
+        self.preset = preset
 
+    @property
+    def tokenizer(self):
+        return self._model.get()[0]
 
-    def generate_text(self, prompt, max_length=500):
-        input_ids = self.tokenizer(prompt, return_tensors="pt").input_ids
-        output = self.model.generate(input_ids, max_length=max_length, num_return_sequences=1)
-        return self.tokenizer.decode(output[0], skip_special_tokens=True)
+    @property
+    def model(self):
+        """The T5 model, loaded on first use (or by `warmup`)."""
+        return self._model.get()[1]
 
+    def warmup(self):
+        """Starts loading the tokenizer and model in a background thread."""
+        return self._model.warmup()
+
+    def generation_kwargs(self, preset=None):
+        preset = preset or self.preset
+        if preset not in self.DECODING_PRESETS:
+            raise NotImplementedError(f"Decoding preset '{preset}' is not implemented. Use one of {list(self.DECODING_PRESETS)}.")
+        return self.DECODING_PRESETS[preset]
+
+    def generate_text(self, prompt, preset=None):
+        return self.generate_texts([prompt], preset=preset)[0]
+
+    def generate_texts(self, prompts, preset=None, batch_size=8):
+        """
+        Generates outputs for several prompts with padded, batched generation.
+        :param prompts: List of input prompts (truncated to `max_input_tokens`).
+        :param preset: Decoding preset (defaults to the merger setting).
+        :param batch_size: Prompts per generate call.
+        :return: List of generated texts, in prompt order.
+        """
+        import torch
+
+        outputs = []
+        for start in range(0, len(prompts), batch_size):
+            inputs = self.tokenizer(
+                prompts[start:start + batch_size], return_tensors="pt", padding=True,
+                truncation=True, max_length=self.max_input_tokens
+            )
+            with torch.inference_mode():
+                generated = self.model.generate(
+                    inputs.input_ids, attention_mask=inputs.attention_mask, num_return_sequences=1,
+                    **self.generation_kwargs(preset)
+                )
+            outputs.extend(self.tokenizer.batch_decode(generated, skip_special_tokens=True))
+        return outputs
 
-    def merge_and_summarize(self, chunks, max_length=2000, min_length=10):
+    def build_prompt(self, chunks, query=None):
+        """
+        Packs the highest-ranked chunks into the token budget, in rank order; the chunk that
+        crosses the budget is cut at a token boundary and the rest are dropped.
+        :param chunks: List of text snippets, best first.
+        :param query: The user's question (None = plain summarization).
+        :return: Prompt string within `max_input_tokens`.
+        """
+        if query:
+            header = f"Answer the question using the context.\nQuestion: {query}\nContext: "
+        else:
+            header = "Summarize this text: "
+        # One batched tokenizer call for the header and every chunk
+        encoded = self.tokenizer([header] + list(chunks), add_special_tokens=False).input_ids
+        budget = self.max_input_tokens - len(encoded[0]) - 1  # room for the end-of-sequence token
+
+        packed = []
+        for chunk, ids in zip(chunks, encoded[1:]):
+            if budget <= 0:
+                break
+            if len(ids) > budget:
+                chunk = self.tokenizer.decode(ids[:budget], skip_special_tokens=True)
+            packed.append(chunk)
+            budget -= len(ids) + 1  # +1 for the separating space
+        return header + " ".join(packed)
+
+    @instrumented("merge")
+    def merge_and_summarize(self, chunks, query=None, preset=None):
         """
         Merges multiple retrieved text chunks and summarizes them using T5.
         :param chunks: List of text snippets.
-        :param max_length: Maximum token length of the summarized output.
-        :param min_length: Minimum length of the summary.
+        :param query: The user's question; included in the prompt when given.
+        :param preset: Decoding preset (defaults to the merger setting).
         :return: Summarized answer.
         """
-        merged_text = " ".join(chunks)  # Merge all retrieved chunks into a single text block
+        return self.generate_text(self.build_prompt(chunks, query), preset=preset)
+
+    def stream_merge(self, chunks, query=None, preset=None, timeout=120):
+        """
+        Streaming `merge_and_summarize`: generation runs in a background thread and decoded
+        text pieces are yielded as soon as they are produced.
+        Streaming needs a single hypothesis, so beam presets fall back to greedy search.
+        :param chunks: List of text snippets.
+        :param query: The user's question; included in the prompt when given.
+        :param preset: Decoding preset (defaults to the merger setting).
+        :param timeout: Seconds to wait for the next token before giving up.
+        :return: Generator of text pieces.
+        """
+        import torch
+        from transformers import TextIteratorStreamer
 
-        # Prepend summarization task (T5 requires a task-specific prefix)
-        input_text = "Summarize this text: " + merged_text  
+        inputs = self.tokenizer(
+            [self.build_prompt(chunks, query)], return_tensors="pt", truncation=True, max_length=self.max_input_tokens
+        )
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=timeout)
+        kwargs = dict(self.generation_kwargs(preset), num_beams=1)
+        kwargs.pop("early_stopping", None)
 
-        outputs = self.generate_text(input_text)
-        
-        return outputs
+        errors = []
+
+        def generate():
+            try:
+                with torch.inference_mode():
+                    self.model.generate(
+                        inputs.input_ids, attention_mask=inputs.attention_mask, streamer=streamer, **kwargs
+                    )
+            except BaseException as e:
+                errors.append(e)
+                streamer.end()  # unblock the consumer instead of leaving it waiting for the timeout
+
+        thread = threading.Thread(target=generate, daemon=True)
+        thread.start()
+        for piece in streamer:
+            if piece:
+                yield piece
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    @instrumented("merge_batch", items=lambda self, chunks_per_query, *args, **kwargs: len(chunks_per_query))
+    def merge_and_summarize_batch(self, chunks_per_query, queries=None, preset=None, batch_size=8):
+        """
+        Batched `merge_and_summarize`: one answer per list of retrieved chunks.
+        :param chunks_per_query: List of text snippet lists.
+        :param queries: Matching list of questions (None = plain summarization).
+        :param preset: Decoding preset (defaults to the merger setting).
+        :param batch_size: Prompts per generate call.
+        :return: List of answers.
+        """
+        queries = queries or [None] * len(chunks_per_query)
+        prompts = [self.build_prompt(chunks, query) for chunks, query in zip(chunks_per_query, queries)]
+        return self.generate_texts(prompts, preset=preset, batch_size=batch_size)
@@ -0,0 +1,170 @@
+import json
+import math
+import re
+import sqlite3
+from collections import Counter
+from pathlib import Path
+
+# Words, numbers and codes such as "px-200", "7731-b" or "v2.1" (kept whole and also split into parts)
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-./]", token) if part)
+    return tokens
+
+
+class BM25Index:
+    """
+    Corpus-level BM25 inverted index over the stored chunks, built incrementally at ingest time.
+    Postings map each term to {slot: term frequency}; slots mirror the vector store's point IDs.
+    Persisted as one SQLite row per chunk, so a save writes only the chunks added or removed since the last.
+    """
+
+    def __init__(self, path=None, k1=1.5, b=0.75):
+        """
+        Initializes the index, loading it from `path` if it exists.
+        :param path: SQLite file used by `save` (None = memory only).
+        :param k1: BM25 term-frequency saturation.
+        :param b: BM25 document-length normalisation.
+        """
+        self.path = Path(path) if path else None
+        self.k1 = k1
+        self.b = b
+        self.point_ids = []  # slot -> point id (None once removed)
+        self.texts = []
+        self.doc_terms = []  # slot -> {term: frequency}, needed to remove a chunk's postings
+        self.doc_lengths = []
+        self.postings = {}
+        self.slot_of = {}
+        self.total_length = 0
+        self._unsaved = set()  # point ids added or removed since the last save
+        self._conn = None
+
+        if self.path and self.path.exists():
+            self.load()
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def add(self, point_ids, texts):
+        """
+        Indexes chunks; re-adding a point ID replaces its previous text.
+        """
+        self.remove([point_id for point_id in point_ids if point_id in self.slot_of])
+        for point_id, text in zip(point_ids, texts):
+            self._add_slot(point_id, text, Counter(tokenize(text)))
+        self._unsaved.update(point_ids)
+
+    def _add_slot(self, point_id, text, term_counts):
+        slot = len(self.point_ids)
+        self.point_ids.append(point_id)
+        self.texts.append(text)
+        self.doc_terms.append(dict(term_counts))
+        length = sum(term_counts.values())
+        self.doc_lengths.append(length)
+        self.total_length += length
+        self.slot_of[point_id] = slot
+        for term, frequency in term_counts.items():
+            self.postings.setdefault(term, {})[slot] = frequency
+
+    def remove(self, point_ids):
+        """
+        Drops chunks from the index.
+        """
+        for point_id in point_ids:
+            slot = self.slot_of.pop(point_id, None)
+            if slot is None:
+                continue
+            self._unsaved.add(point_id)
+            for term in self.doc_terms[slot]:
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(slot, None)
+                    if not postings:
+                        del self.postings[term]
+            self.total_length -= self.doc_lengths[slot]
+            self.point_ids[slot] = None
+            self.texts[slot] = None
+            self.doc_terms[slot] = {}
+            self.doc_lengths[slot] = 0
+
+    def search(self, query, top_k=5):
+        """
+        Scores chunks containing at least one query term.
+        :return: List of (point_id, text, score) tuples, highest score first.
+        """
+        count = len(self.slot_of)
+        if count == 0:
+            return []
+        average_length = self.total_length / count
+
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for slot, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[slot] / average_length)
+                scores[slot] = scores.get(slot, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.point_ids[slot], self.texts[slot], score) for slot, score in best]
+
+    def _connect(self, path):
+        conn = sqlite3.connect(str(path))
+        conn.execute("CREATE TABLE IF NOT EXISTS chunks (point_id TEXT PRIMARY KEY, text TEXT NOT NULL, "
+                     "terms TEXT NOT NULL)")
+        return conn
+
+    def _row(self, point_id):
+        slot = self.slot_of[point_id]
+        return point_id, self.texts[slot], json.dumps(self.doc_terms[slot])
+
+    def save(self):
+        """
+        Writes the chunks added or removed since the last save to `path` in one transaction.
+        """
+        if self.path is None:
+            raise ValueError("BM25Index has no path to save to.")
+        if not self._unsaved:
+            return
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = self._connect(self.path)
+        with self._conn:
+            self._conn.executemany("DELETE FROM chunks WHERE point_id = ?",
+                                   [(pid,) for pid in self._unsaved if pid not in self.slot_of])
+            self._conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)",
+                                   [self._row(pid) for pid in self._unsaved if pid in self.slot_of])
+        self._unsaved.clear()
+
+    def flush(self):
+        """Persists the changes if the index has a path (called by IngestPipeline at each checkpoint)."""
+        if self.path is not None:
+            self.save()
+
+    def load(self):
+        self._conn = self._connect(self.path)
+        for point_id, text, terms in self._conn.execute("SELECT point_id, text, terms FROM chunks"):
+            self._add_slot(point_id, text, json.loads(terms))
+
+
+def reciprocal_rank_fusion(rankings, top_k=5, k=60):
+    """
+    Fuses several ranked lists of texts with reciprocal rank fusion.
+    :param rankings: List of ranked text lists (best first).
+    :param top_k: Number of fused results.
+    :param k: RRF damping constant.
+    :return: Fused list of texts, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, text in enumerate(ranking):
+            scores[text] = scores.get(text, 0.0) + 1.0 / (k + rank + 1)
+    return [text for text, _ in sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]]
@@ -0,0 +1,52 @@
+import base64
+import binascii
+import hashlib
+
+from modules.sqlite_cache import SQLiteLRUCache
+
+
+class CaptionCache(SQLiteLRUCache):
+    """
+    Persistent, content-addressed cache of VLM captions backed by SQLite.
+    Entries are keyed by a hash of the image bytes, prompt and model id, and evicted least-recently-used.
+    """
+
+    table = "caption_entries"
+
+    def __init__(self, db_path="cache/captions.sqlite", max_entries=100_000):
+        """
+        Opens (or creates) the cache database.
+        :param db_path: Path of the SQLite file.
+        :param max_entries: Maximum number of captions kept before LRU eviction.
+        """
+        super().__init__(db_path, max_entries)
+
+    @staticmethod
+    def make_key(image_base64, prompt, model_id):
+        """
+        Builds the cache key from the decoded image bytes, so equal images hash equally
+        regardless of base64 formatting.
+        """
+        try:
+            image_bytes = base64.b64decode(image_base64, validate=False)
+        except (binascii.Error, ValueError):
+            image_bytes = image_base64.encode("utf-8")
+
+        digest = hashlib.sha256()
+        for part in (image_bytes, prompt.encode("utf-8"), model_id.encode("utf-8")):
+            digest.update(len(part).to_bytes(8, "little"))  # length-prefix to keep fields unambiguous
+            digest.update(part)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached caption for `key`, or None on a miss.
+        """
+        value = super().get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def put(self, key, caption, generation_seconds=0.0):
+        """
+        Stores a caption along with the VLM time it took to generate.
+        """
+        super().put(key, caption.encode("utf-8"), generation_seconds)
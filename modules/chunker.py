@@ -0,0 +1,186 @@
+"""
+Token-aware chunking of parsed content entries, sized by the embedding model's own tokenizer.
+"""
+from itertools import islice
+
+
+class TokenChunker:
+    """
+    Packs content entries into chunks of at most `max_tokens` embedding-tokenizer tokens:
+    consecutive small text entries are merged, entries longer than the budget are split into
+    overlapping windows, and every chunk records the elements, pages and character offsets it covers.
+    Image captions are never merged, so their image metadata stays attached to them.
+    """
+
+    # Bump when the chunks produced for the same settings change, so manifests re-ingest
+    VERSION = 2
+
+    def __init__(self, tokenizer, max_tokens=256, overlap_tokens=32, window=512):
+        """
+        Initializes the chunker.
+        :param tokenizer: Fast (Rust) Hugging Face tokenizer of the embedding model, e.g. `TextProcessor.tokenizer`.
+        :param max_tokens: Token budget per chunk, special tokens included; use the model's `max_seq_length`.
+        :param overlap_tokens: Tokens repeated at the start of a chunk from the end of the previous one.
+        :param window: Entries tokenized per batched tokenizer call while streaming.
+        """
+        if not getattr(tokenizer, "is_fast", False):
+            raise ValueError("TokenChunker needs a fast tokenizer (character offsets are used to slice text).")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.budget = max_tokens - tokenizer.num_special_tokens_to_add()
+        self.overlap_tokens = min(overlap_tokens, self.budget // 2)
+        self.window = window
+
+    @property
+    def config_id(self):
+        """Identifies the chunking settings; part of the ingest manifest version."""
+        return f"tok{self.max_tokens}-o{self.overlap_tokens}-v{self.VERSION}"
+
+    def count_tokens(self, texts):
+        """Token counts of `texts` (without special tokens), in one batched call."""
+        return [len(ids) for ids in self.tokenizer(list(texts), add_special_tokens=False).input_ids]
+
+    def chunk_document(self, items):
+        """
+        Chunks a whole document; all entries are tokenized in a single batched call.
+        :param items: List of (text, metadata) pairs, metadata as produced by `TextProcessor.item_metadata`.
+        :return: List of (chunk text, chunk metadata) pairs.
+        """
+        return list(self._chunk_window(items, _PackState()))
+
+    def iter_chunks(self, items):
+        """
+        Streaming variant of `chunk_document`: tokenizes `window` entries at a time and yields chunks
+        as soon as they are complete, so memory does not grow with the document.
+        :param items: Iterable of (text, metadata) pairs.
+        :return: Generator of (chunk text, chunk metadata) pairs.
+        """
+        items = iter(items)
+        state = _PackState()
+        while True:
+            batch = list(islice(items, self.window))
+            if not batch:
+                break
+            yield from self._chunk_window(batch, state, final=False)
+        yield from self._flush(state)
+
+    def _chunk_window(self, items, state, final=True):
+        if items:
+            encoded = self.tokenizer(
+                [text for text, _ in items], add_special_tokens=False, return_offsets_mapping=True
+            )
+            for (text, metadata), offsets in zip(items, encoded["offset_mapping"]):
+                yield from self._add(state, text, metadata, offsets)
+        if final:
+            yield from self._flush(state)
+
+    def _add(self, state, text, metadata, offsets):
+        n_tokens = len(offsets)
+        if n_tokens == 0:
+            return
+        is_text = metadata.get("type") == "text"
+        if not is_text or n_tokens > self.budget:
+            # Captions stay standalone (a caption longer than the budget is split like any text) and keep
+            # the overlap of the text before them for the text after them
+            yield from self._flush(state)
+            yield from self._split(text, metadata, offsets)
+            if is_text:
+                state.carry = self._tail(text, metadata, offsets, len(text))
+            return
+
+        # +1 for the separator between merged entries
+        if state.parts and state.tokens + 1 + n_tokens > self.budget:
+            yield from self._flush(state)
+        if not state.parts and state.carry is not None and state.carry[2] + 1 + n_tokens <= self.budget:
+            state.append(*state.carry)
+        state.append(text, metadata, n_tokens, 0, len(text), offsets)
+
+    def _tail(self, text, metadata, offsets, char_end):
+        """
+        The last `overlap_tokens` of an entry, carried into the next chunk as overlap.
+        :return: (text, metadata, tokens, char_start, char_end) of the tail, or None.
+        """
+        if not self.overlap_tokens or offsets is None:
+            return None
+        start_token = self._word_start(offsets, max(0, len(offsets) - self.overlap_tokens))
+        return text, metadata, len(offsets) - start_token, offsets[start_token][0], char_end
+
+    def _split(self, text, metadata, offsets):
+        """
+        Splits one long entry into overlapping windows of at most `budget` tokens, cut at word boundaries.
+        """
+        n_tokens = len(offsets)
+        start = 0
+        while start < n_tokens:
+            end = min(start + self.budget, n_tokens)
+            if end < n_tokens:
+                end = self._word_start(offsets, end, lower=start + self.budget // 2)
+            char_start, char_end = offsets[start][0], offsets[end - 1][1]
+            yield text[char_start:char_end], self._metadata([(metadata, char_start, char_end)])
+            if end >= n_tokens:
+                break
+            start = max(self._word_start(offsets, end - self.overlap_tokens, lower=start + 1), start + 1)
+
+    @staticmethod
+    def _word_start(offsets, index, lower=0):
+        """
+        Moves `index` back to the first sub-word token of its word (a token preceded by whitespace
+        or the text start), without going below `lower`.
+        """
+        i = index
+        while i > lower and offsets[i][0] == offsets[i - 1][1]:
+            i -= 1
+        return i if i > lower else index  # a single word spans the whole range: cut inside it
+
+    def _flush(self, state):
+        """
+        Emits the pending chunk; its tail becomes the overlap carried into the next one.
+        """
+        if state.parts:
+            text, metadata, _, _, char_end, offsets = state.last
+            state.carry = self._tail(text, metadata, offsets, char_end)
+            texts = [text[start:end] for text, _, _, start, end, _ in state.parts]
+            spans = [(metadata, start, end) for _, metadata, _, start, end, _ in state.parts]
+            state.clear()
+            yield " ".join(texts), self._metadata(spans)
+
+    @staticmethod
+    def _metadata(spans):
+        """
+        Chunk payload: the fields of the first source entry plus the range of entries, pages and
+        character offsets it covers (`char_start` in the first entry, `char_end` in the last).
+        """
+        first, char_start, _ = spans[0]
+        last, _, char_end = spans[-1]
+        metadata = dict(first)
+        metadata.update({
+            "element_end": last.get("element_index"),
+            "page_end": last.get("page"),
+            "char_start": char_start,
+            "char_end": char_end,
+        })
+        return metadata
+
+
+class _PackState:
+    """
+    Entries waiting to be packed into the next chunk: (text, metadata, tokens, char_start, char_end, offsets).
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.tokens = 0
+        self.carry = None  # overlap tail of the last emitted chunk, prepended to the next one if it fits
+
+    @property
+    def last(self):
+        return self.parts[-1]
+
+    def append(self, text, metadata, n_tokens, char_start, char_end, offsets=None):
+        self.carry = None
+        self.tokens += n_tokens + (1 if self.parts else 0)
+        self.parts.append((text, metadata, n_tokens, char_start, char_end, offsets))
+
+    def clear(self):
+        self.parts = []
+        self.tokens = 0
@@ -1,33 +1,80 @@
 import base64
+import hashlib
+import io
+from importlib.metadata import version, PackageNotFoundError
 from pathlib import Path
-from docling_core.types.doc import PictureItem, TextItem
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from modules.vlm_service import VLMService  # Importing the VLM service
+from typing import TYPE_CHECKING
+from modules.instrumentation import instrumented
+from modules.startup import LazyResource, profiler
+
+if TYPE_CHECKING:
+    from modules.vlm_service import VLMService  # Importing the VLM service (annotation only; the caller builds it)
+# docling is imported when the converter is first needed; `parser_version` works without it
 
 class DocumentParser:
     """
     Parses PDF documents, extracts text & images, and outputs structured JSON.
     """
 
-    def __init__(self, vlm_service: VLMService):
+    # Bump when the structure or content of `parse_pdf` output changes, so manifests re-ingest
+    PIPELINE_VERSION = "3"
+
+    def __init__(self, vlm_service: "VLMService", max_concurrent_captions=8, image_dir="output",
+                 caption_max_side=1024, caption_format="JPEG", caption_quality=85):
         """
         Initializes the parser with a VLM service instance.
+        :param vlm_service: VLMService used to caption extracted pictures.
+        :param max_concurrent_captions: Maximum number of caption requests in flight at once.
+        :param image_dir: Directory where pictures are stored once, named by content hash (None = don't write images).
+        :param caption_max_side: Longest side, in pixels, of the image sent for captioning (None = original size).
+        :param caption_format: Encoding of the image sent for captioning ("JPEG" or "PNG").
+        :param caption_quality: JPEG quality used for captioning.
         """
         self.vlm_service = vlm_service  # Inject VLM service for captioning
-        self.output_dir = Path("output")
-        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.max_concurrent_captions = max(1, max_concurrent_captions)
+        self.output_dir = Path(image_dir) if image_dir else None
+        if self.output_dir:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.caption_max_side = caption_max_side
+        self.caption_format = caption_format
+        self.caption_quality = caption_quality
+        self._converter = LazyResource(self.load_converter)
+
+    @staticmethod
+    def load_converter():
+        with profiler.measure("docling", "import"):
+            from docling.datamodel.base_models import InputFormat
+            from docling.datamodel.pipeline_options import PdfPipelineOptions
+            from docling.document_converter import DocumentConverter, PdfFormatOption
 
         # Docling configuration
-        self.pipeline_options = PdfPipelineOptions()
-        self.pipeline_options.images_scale = 2  # Adjust scale
-        self.pipeline_options.generate_page_images = True
-        self.pipeline_options.generate_picture_images = True
+        pipeline_options = PdfPipelineOptions()
+        pipeline_options.images_scale = 2  # Adjust scale
+        pipeline_options.generate_page_images = False  # only picture crops are used, full pages just cost memory
+        pipeline_options.generate_picture_images = True
+
+        with profiler.measure("docling", "load"):
+            return DocumentConverter(
+                format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)}
+            )
 
-        self.doc_converter = DocumentConverter(
-            format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=self.pipeline_options)}
-        )
+    @property
+    def doc_converter(self):
+        """The docling DocumentConverter, created on first use (or by `warmup`)."""
+        return self._converter.get()
+
+    def warmup(self):
+        """Starts importing docling and building the converter in a background thread."""
+        return self._converter.warmup()
+
+    @classmethod
+    def parser_version(cls):
+        """Version string identifying this parser's output (pipeline version + docling version)."""
+        try:
+            docling_version = version("docling")
+        except PackageNotFoundError:
+            docling_version = "unknown"
+        return f"{cls.PIPELINE_VERSION}+docling-{docling_version}"
 
     @staticmethod
     def encode_image_to_base64(image_path):
@@ -35,36 +82,139 @@ class DocumentParser:
         with open(image_path, "rb") as img_file:
             return base64.b64encode(img_file.read()).decode("utf-8")
 
+    @staticmethod
+    def encode_image(image, max_side=None, image_format="JPEG", quality=85):
+        """
+        Encodes a PIL image to a base64 string in memory, optionally downscaled.
+        :param image: PIL image.
+        :param max_side: Longest side in pixels after downscaling (None = keep size).
+        :param image_format: "JPEG" or "PNG".
+        :param quality: JPEG quality.
+        :return: Base64-encoded image string.
+        """
+        if max_side and max(image.size) > max_side:
+            image = image.copy()
+            image.thumbnail((max_side, max_side))
+        if image_format.upper() in ("JPEG", "JPG") and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")  # JPEG has no alpha channel
+
+        buffer = io.BytesIO()
+        if image_format.upper() in ("JPEG", "JPG"):
+            image.save(buffer, "JPEG", quality=quality)
+        else:
+            image.save(buffer, image_format)
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+    @staticmethod
+    def image_hash(image):
+        """Content hash of a PIL image, computed from its mode, size and raw pixels."""
+        digest = hashlib.sha256(f"{image.mode}:{image.size}".encode("utf-8"))
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def store_image(self, image, image_hash):
+        """
+        Writes a picture to `image_dir` once, under its content hash.
+        :return: Path of the stored PNG, or None when images are not written to disk.
+        """
+        if self.output_dir is None:
+            return None
+        image_path = self.output_dir / f"{image_hash}.png"
+        if not image_path.exists():  # identical pictures across documents are stored once
+            image.save(image_path, "PNG")
+        return str(image_path)
+
+    @staticmethod
+    def page_number(element):
+        """Returns the 1-based page an element was found on, or None if docling has no provenance."""
+        return element.prov[0].page_no if element.prov else None
+
+    @instrumented("caption_batch", items=lambda self, images_base64, *args, **kwargs: len(images_base64))
+    def caption_images(self, images_base64, prompt="Describe this image."):
+        """
+        Captions a list of images concurrently, bounded by `max_concurrent_captions`.
+        :param images_base64: List of base64-encoded images.
+        :param prompt: Captioning prompt sent with every image.
+        :return: List of CaptionResult in the same order as `images_base64`.
+        """
+        return self.vlm_service.generate_captions(images_base64, prompt=prompt, max_concurrency=self.max_concurrent_captions)
+
+    @instrumented("parse_pdf")
     def parse_pdf(self, pdf_path):
         """
         Parses a PDF and extracts structured text & images.
         :param pdf_path: Path to the PDF file.
         :return: Dictionary containing structured document data.
         """
+        pdf_path = Path(pdf_path)
+        return {"document": pdf_path.stem, "content": list(self.iter_elements(pdf_path))}
+
+    def iter_elements(self, pdf_path, caption_window=None, max_pending=256):
+        """
+        Parses a PDF and yields its text & image entries in document order, as `parse_pdf` would list them.
+        Pictures are captioned concurrently in windows, so only one window of entries is held at a time.
+        :param pdf_path: Path to the PDF file.
+        :param caption_window: Pictures captioned per concurrent batch (default: 4 x `max_concurrent_captions`).
+        :param max_pending: Entries held behind uncaptioned pictures before they are captioned early, so
+                            text-heavy documents with sparse pictures still stream.
+        :return: Generator of content entries.
+        """
+        from docling_core.types.doc import PictureItem, TextItem
+
         pdf_path = Path(pdf_path)
         conv_res = self.doc_converter.convert(pdf_path)
-        doc_filename = pdf_path.stem
-        structured_data = {"document": doc_filename, "content": []}
+        caption_window = caption_window or 4 * self.max_concurrent_captions
+        pending = []  # Entries held back until the pictures among them are captioned
+        picture_items = []  # Image entries waiting for a caption, in document order
+        picture_images = []  # Base64 payloads for `picture_items`, dropped once captioned
         picture_counter = 0
 
         for element, _level in conv_res.document.iterate_items():
             if isinstance(element, TextItem):
-                structured_data["content"].append({"type": "text", "text": element.text.strip()})
+                entry = {
+                    "type": "text",
+                    "text": element.text.strip(),
+                    "page": self.page_number(element)
+                }
+                if not pending:
+                    yield entry  # Nothing waiting on a caption, so order is already preserved
+                else:
+                    pending.append(entry)
 
             elif isinstance(element, PictureItem):
                 picture_counter += 1
-                image_path = self.output_dir / f"{doc_filename}-picture-{picture_counter}.png"
-                element.get_image(conv_res.document).save(image_path, "PNG")
-                base64_img = self.encode_image_to_base64(image_path)
-
-                # Generate real caption using VLMService
-                caption = self.vlm_service.generate_caption(base64_img, prompt="Describe this image.")
+                image = element.get_image(conv_res.document)
+                image_hash = self.image_hash(image)
 
-                structured_data["content"].append({
+                image_item = {
                     "type": "image",
                     "index": picture_counter,
-                    "image_base64": base64_img,
-                    "caption": caption
-                })
+                    "page": self.page_number(element),
+                    "image_hash": image_hash,
+                    "image_path": self.store_image(image, image_hash),
+                    "caption": None
+                }
+                pending.append(image_item)
+                picture_items.append(image_item)
+                picture_images.append(
+                    self.encode_image(image, self.caption_max_side, self.caption_format, self.caption_quality)
+                )
 
-        return structured_data
+            if picture_items and (len(picture_items) >= caption_window or len(pending) >= max_pending):
+                self._apply_captions(picture_items, picture_images)
+                yield from pending
+                pending, picture_items, picture_images = [], [], []
+
+        self._apply_captions(picture_items, picture_images)
+        yield from pending
+
+    def _apply_captions(self, picture_items, picture_images):
+        """
+        Captions a window of image entries in one concurrent stage and writes the results back in place.
+        """
+        captions = self.caption_images(picture_images)
+        for image_item, result in zip(picture_items, captions):
+            # Failed captions stay None so they are never embedded as text
+            image_item["caption"] = result.caption if result.ok else None
+            if not result.ok:
+                image_item["caption_error"] = result.error
@@ -0,0 +1,45 @@
+import hashlib
+
+import numpy as np
+
+from modules.sqlite_cache import SQLiteLRUCache
+
+
+class EmbeddingCache(SQLiteLRUCache):
+    """
+    Persistent cache of text embeddings keyed by a hash of the text and the embedding model name.
+    Shared by ingest (repeated boilerplate chunks) and query serving (repeated questions).
+    """
+
+    table = "embedding_entries"
+
+    def __init__(self, db_path="cache/embeddings.sqlite", max_entries=500_000):
+        """
+        Opens (or creates) the cache database.
+        :param db_path: Path of the SQLite file.
+        :param max_entries: Maximum number of embeddings kept before LRU eviction.
+        """
+        super().__init__(db_path, max_entries)
+
+    @staticmethod
+    def make_key(text, model_name):
+        digest = hashlib.sha256(model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_embeddings(self, keys):
+        """
+        Looks up several embeddings at once.
+        :return: Dictionary of the keys that were found and their float32 vectors.
+        """
+        return {key: np.frombuffer(value, dtype=np.float32) for key, value in self.get_many(keys).items()}
+
+    def put_embeddings(self, keys, embeddings, seconds_per_item=0.0):
+        """
+        Stores float32 vectors for the given keys.
+        """
+        self.put_many([
+            (key, np.asarray(vector, dtype=np.float32).tobytes(), seconds_per_item)
+            for key, vector in zip(keys, embeddings)
+        ])
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+
+class IngestManifest:
+    """
+    Records what has been ingested into a collection: per PDF its content hash, the parser and
+    embedding versions used, and the produced point IDs. Lets re-runs skip unchanged documents
+    and clean up points of changed or removed ones.
+    """
+
+    def __init__(self, manifest_path, parser_version, embedding_model):
+        """
+        Loads the manifest if it exists.
+        :param manifest_path: JSON file holding the manifest.
+        :param parser_version: Version string of the parsing/captioning pipeline.
+        :param embedding_model: Name of the embedding model; a change invalidates every entry.
+        """
+        self.manifest_path = Path(manifest_path)
+        self.parser_version = parser_version
+        self.embedding_model = embedding_model
+        self.documents = {}
+
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.documents = json.load(f).get("documents", {})
+
+    @staticmethod
+    def key(pdf_path):
+        """Manifest key of a PDF: its resolved absolute path."""
+        return str(Path(pdf_path).resolve())
+
+    @staticmethod
+    def file_hash(pdf_path, block_size=1 << 20):
+        """
+        Computes the SHA-256 of a file without loading it fully into memory.
+        """
+        digest = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def get(self, pdf_path):
+        return self.documents.get(self.key(pdf_path))
+
+    def is_current(self, pdf_path, content_hash):
+        """
+        True when `pdf_path` was ingested with the same content and the same parser/embedding versions,
+        and all its pictures were captioned.
+        """
+        entry = self.get(pdf_path)
+        return (
+            entry is not None
+            and entry["content_hash"] == content_hash
+            and entry["parser_version"] == self.parser_version
+            and entry["embedding_model"] == self.embedding_model
+            and not entry.get("caption_errors")
+        )
+
+    def record(self, pdf_path, content_hash, document_id, point_ids, caption_errors=0):
+        """
+        Stores (or replaces) the entry of an ingested PDF.
+        :param caption_errors: Pictures left uncaptioned (e.g. VLM server down); the entry is then never current.
+        """
+        self.documents[self.key(pdf_path)] = {
+            "document": document_id,
+            "content_hash": content_hash,
+            "parser_version": self.parser_version,
+            "embedding_model": self.embedding_model,
+            "point_ids": list(point_ids),
+            "caption_errors": caption_errors,
+            "ingested_at": time.time(),
+        }
+
+    def remove(self, pdf_path_or_key):
+        """
+        Drops an entry and returns it (or None if it was not recorded).
+        """
+        return self.documents.pop(self.key(pdf_path_or_key), None)
+
+    def missing_documents(self, present_paths):
+        """
+        Returns the manifest keys whose PDF is not among `present_paths`.
+        """
+        present = {self.key(path) for path in present_paths}
+        return [key for key in self.documents if key not in present]
+
+    def save(self):
+        """
+        Writes the manifest atomically, so an interrupted run never leaves it half-written.
+        """
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(self.manifest_path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"documents": self.documents}, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,224 @@
+"""
+This class implements the ingest pipeline handler: parse, embed and store PDFs in the vector database.
+"""
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from modules.ingest_manifest import IngestManifest
+from modules import instrumentation
+from modules.instrumentation import instrumented
+
+
+class IngestPipeline:
+    """
+    Turns PDFs into stored vectors, optionally skipping documents already recorded in an IngestManifest.
+    """
+
+    def __init__(self, doc_parser, text_processor, vector_db, manifest: IngestManifest = None, batch_size=256,
+                 bm25_index=None, chunker=None, root=None, save_every=16):
+        """
+        Initializes the ingest pipeline.
+
+        :param doc_parser: DocumentParser instance.
+        :param text_processor: TextProcessor instance.
+        :param vector_db: VectorDBHandler instance.
+        :param manifest: IngestManifest of the collection (Optional; without it every call re-ingests).
+        :param batch_size: Chunks embedded and upserted together; bounds memory while streaming.
+        :param bm25_index: BM25Index kept in sync with the vector store for hybrid retrieval (Optional).
+        :param chunker: TokenChunker packing entries into model-sized chunks (Optional; without it each
+                        entry is embedded as is and long ones are truncated by the model).
+        :param root: Directory document ids are relative to (default: the working directory).
+        :param save_every: Documents stored between checkpoints of the indexes and the manifest; call `close()`
+                           after the last one. A crash loses at most this many manifest entries, and those
+                           documents are simply re-ingested onto the same point IDs on the next run.
+        """
+        self.doc_parser = doc_parser
+        self.text_processor = text_processor
+        self.vector_db = vector_db
+        self.manifest = manifest
+        self.batch_size = batch_size
+        self.bm25_index = bm25_index
+        self.chunker = chunker
+        self.root = Path(root or Path.cwd()).resolve()
+        self.save_every = save_every
+        self._unsaved = 0  # documents stored since the last checkpoint
+        self.stats = defaultdict(float)  # accumulated per-stage seconds and item counts
+
+    @instrumented("ingest_pdf")
+    def ingest_pdf(self, pdf_path, force=False):
+        """
+        Streams a PDF through parsing, captioning, embedding and upserting unless the manifest shows it is unchanged.
+
+        :param pdf_path: Path to the PDF file.
+        :param force: Re-ingest even if the manifest says the PDF is up to date.
+        :return: Summary dict with the document id, status ("skipped" or "ingested") and chunk count.
+        """
+        content_hash = IngestManifest.file_hash(pdf_path) if self.manifest else None
+        if self.manifest and not force and self.manifest.is_current(pdf_path, content_hash):
+            entry = self.manifest.get(pdf_path)
+            return {"document": entry["document"], "status": "skipped", "chunks": len(entry["point_ids"])}
+
+        return self.store_elements(self.document_id(pdf_path), self._timed_elements(pdf_path), pdf_path, content_hash)
+
+    def document_id(self, pdf_path):
+        """
+        Document id of a PDF: its path relative to `root` without the suffix, so equally named files in
+        different directories stay apart. PDFs outside `root` use their absolute path.
+        """
+        path = Path(pdf_path).resolve()
+        try:
+            path = path.relative_to(self.root)
+        except ValueError:
+            pass
+        return path.with_suffix("").as_posix()
+
+    def store_document(self, structured_data, pdf_path=None, content_hash=None):
+        """
+        Embeds and stores an already parsed document, replacing the points of its previous version.
+
+        :param structured_data: Output of DocumentParser.parse_pdf.
+        :param pdf_path: Source PDF, needed to update the manifest; also gives the document id.
+        :param content_hash: Hash of the source PDF (computed if missing and a manifest is used).
+        :return: Summary dict with the document id, status and chunk count.
+        """
+        document_id = self.document_id(pdf_path) if pdf_path is not None else structured_data["document"]
+        return self.store_elements(document_id, structured_data["content"], pdf_path, content_hash)
+
+    def store_elements(self, document_id, elements, pdf_path=None, content_hash=None):
+        """
+        Embeds and upserts content entries in fixed-size batches as they arrive, so memory stays
+        bounded by `batch_size` regardless of document length.
+
+        :param document_id: Identifier of the document.
+        :param elements: Iterable of content entries (list or generator from DocumentParser.iter_elements).
+        :param pdf_path: Source PDF, needed to update the manifest.
+        :param content_hash: Hash of the source PDF (computed if missing and a manifest is used).
+        :return: Summary dict with the document id, status and chunk count.
+        """
+        point_ids = []
+        texts, metadata = [], []
+
+        caption_errors = []  # filled by `_items` as the entries stream past
+        chunks = self._items(elements, caption_errors)
+        if self.chunker is not None:
+            chunks = self.chunker.iter_chunks(chunks)
+        try:
+            for text, chunk_metadata in chunks:
+                texts.append(text)
+                metadata.append(chunk_metadata)
+
+                if len(texts) >= self.batch_size:
+                    point_ids.extend(self._store_batch(document_id, texts, metadata, start_index=len(point_ids)))
+                    texts, metadata = [], []
+
+            if texts:
+                point_ids.extend(self._store_batch(document_id, texts, metadata, start_index=len(point_ids)))
+        except BaseException:
+            # Parsing failed mid-stream: drop the half-stored document so the next run re-ingests it cleanly
+            previous = self.manifest.remove(pdf_path) if self.manifest and pdf_path is not None else None
+            self._delete_points(set(point_ids) | set(previous["point_ids"] if previous else ()))
+            self._unsaved += 1  # the next checkpoint must persist the removal
+            raise
+        self.stats["documents"] += 1
+
+        if self.manifest and pdf_path is not None:
+            previous = self.manifest.get(pdf_path)
+            if previous:
+                # Points of the old version that the new one did not overwrite are stale
+                self._delete_points(set(previous["point_ids"]) - set(point_ids))
+            self.manifest.record(pdf_path, content_hash or IngestManifest.file_hash(pdf_path), document_id, point_ids,
+                                 caption_errors=len(caption_errors))
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.checkpoint()
+        return {"document": document_id, "status": "ingested", "chunks": len(point_ids)}
+
+    def _items(self, elements, caption_errors):
+        """
+        (text, metadata) pairs of the content entries that have something to embed.
+        Images whose caption failed are appended to `caption_errors`.
+        """
+        for element_index, item in enumerate(elements):
+            if item.get("caption_error"):
+                caption_errors.append(element_index)
+            text = self.text_processor.item_text(item)
+            if text is not None:
+                yield text, self.text_processor.item_metadata(item, element_index)
+
+    def _delete_points(self, point_ids):
+        self.vector_db.delete_points(point_ids)
+        if self.bm25_index is not None:
+            self.bm25_index.remove(point_ids)
+
+    def checkpoint(self):
+        """
+        Persists the indexes, then the manifest, so the manifest never claims points that are not durable.
+        """
+        self.vector_db.flush()
+        if self.bm25_index is not None:
+            self.bm25_index.flush()
+        if self.manifest:
+            self.manifest.save()
+        self._unsaved = 0
+
+    def close(self):
+        """
+        Writes the documents stored since the last checkpoint.
+        """
+        if self._unsaved:
+            self.checkpoint()
+
+    def _store_batch(self, document_id, texts, metadata, start_index):
+        start = time.perf_counter()
+        embeddings = self.text_processor.embed_chunks(texts)
+        self.stats["embed_seconds"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        point_ids = self.vector_db.store_vectors(
+            texts, embeddings, document_id=document_id, metadata=metadata,
+            batch_size=self.batch_size, start_index=start_index
+        )
+        if self.bm25_index is not None:
+            self.bm25_index.add(point_ids, texts)
+        self.stats["store_seconds"] += time.perf_counter() - start
+        self.stats["chunks"] += len(point_ids)
+        return point_ids
+
+    def _timed_elements(self, pdf_path):
+        """
+        Wraps DocumentParser.iter_elements, attributing time spent producing entries to the parse stage.
+        """
+        elements = self.doc_parser.iter_elements(pdf_path)
+        parse_seconds = 0.0
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(elements)
+            except StopIteration:
+                parse_seconds += time.perf_counter() - start
+                break
+            parse_seconds += time.perf_counter() - start
+            yield item
+        self.stats["parse_seconds"] += parse_seconds
+        if instrumentation.is_enabled():
+            # Streaming ingest bypasses parse_pdf; report the interleaved parse time under the same stage
+            instrumentation.registry.observe("parse_pdf", parse_seconds)
+
+    def remove_missing(self, present_paths):
+        """
+        Deletes the points of every manifest entry whose PDF is no longer among `present_paths`.
+
+        :param present_paths: PDFs that make up the corpus now.
+        :return: List of removed manifest keys.
+        """
+        if not self.manifest:
+            return []
+
+        removed = self.manifest.missing_documents(present_paths)
+        for key in removed:
+            entry = self.manifest.remove(key)
+            self._delete_points(entry["point_ids"])
+        if removed:
+            self.checkpoint()
+        return removed
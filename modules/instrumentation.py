@@ -0,0 +1,329 @@
+"""
+Lightweight pipeline instrumentation: per-stage latency histograms, call / error / item counters,
+cache hit rates and the process memory high-water mark, exported as Prometheus text or JSON,
+with optional OpenTelemetry spans.
+
+Disabled by default; while disabled an instrumented call costs one global flag check.
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+import warnings
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource  # POSIX only
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+# Upper bounds (seconds) of the latency histogram buckets; the sub-millisecond ones keep quantiles
+# of fast stages (cache lookups, BM25, small searches) within a bucket of their true value
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PREFIX = "pdfsearch"
+
+_enabled = False
+_tracer = None
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram (Prometheus semantics, stored non-cumulatively).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot: above the largest bucket
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimates the q-quantile by linear interpolation inside its bucket, bounded by the observed extremes.
+        The result is only as precise as the bucket it falls in.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = max(self.buckets[i - 1] if i > 0 else 0.0, self.min)
+                upper = min(self.buckets[i] if i < len(self.buckets) else self.max, self.max)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of the recorded metrics; `registry` below is the process-wide instance.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}  # stage -> Histogram
+        self.counters = {}  # (metric, stage) -> value
+        self.peak_rss_bytes = 0
+        self.caches = {}  # name -> object with stats() (hits, misses, hit_rate, entries)
+        self.remote_caches = {}  # name -> {source pid: (hits, misses)} merged from other processes
+
+    def observe(self, stage, seconds, items=None, error=False):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+            if items is not None:
+                self.counters[("items", stage)] = self.counters.get(("items", stage), 0) + items
+            if error:
+                self.counters[("errors", stage)] = self.counters.get(("errors", stage), 0) + 1
+
+    def update_memory(self):
+        """
+        Records the process peak resident set size (ru_maxrss is KiB on Linux). It is a high-water mark,
+        so sampling it at export time loses nothing and keeps the syscall off the instrumented path.
+        """
+        if resource is not None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            if peak > self.peak_rss_bytes:
+                self.peak_rss_bytes = peak
+
+    def register_cache(self, name, cache):
+        """Reports `cache.stats()` (hits, misses, hit_rate) under `name` at export time; None is ignored."""
+        if cache is not None:
+            self.caches[name] = cache
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.remote_caches.clear()
+            self.peak_rss_bytes = 0
+
+    def snapshot(self, reset=False):
+        """
+        Raw, picklable state of this registry, to be merged into another process's registry with `merge`
+        (e.g. from ingest pool workers, which each record into their own registry).
+        :param reset: Clear histograms and counters afterwards, so the next snapshot only holds what follows.
+        """
+        self.update_memory()
+        caches = {name: cache.stats() for name, cache in self.caches.items()}
+        with self._lock:
+            snapshot = {
+                "source": os.getpid(),
+                "histograms": {stage: (h.buckets, list(h.counts), h.count, h.sum, h.min, h.max)
+                               for stage, h in self.histograms.items()},
+                "counters": dict(self.counters),
+                "caches": {name: (stats["hits"], stats["misses"]) for name, stats in caches.items()},
+                "peak_rss_bytes": self.peak_rss_bytes,
+            }
+            if reset:
+                self.histograms.clear()
+                self.counters.clear()
+        return snapshot
+
+    def merge(self, snapshot):
+        """
+        Adds another process's `snapshot` to this registry. Cache counters are cumulative per source, and
+        the peak memory reported is that of the largest process.
+        """
+        with self._lock:
+            for stage, (buckets, counts, count, total, low, high) in snapshot["histograms"].items():
+                histogram = self.histograms.get(stage)
+                if histogram is None:
+                    histogram = self.histograms[stage] = Histogram(tuple(buckets))
+                for i, n in enumerate(counts):
+                    histogram.counts[i] += n
+                histogram.count += count
+                histogram.sum += total
+                histogram.min = min(histogram.min, low)
+                histogram.max = max(histogram.max, high)
+            for key, value in snapshot["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, counts in snapshot["caches"].items():
+                self.remote_caches.setdefault(name, {})[snapshot["source"]] = counts
+            self.peak_rss_bytes = max(self.peak_rss_bytes, snapshot["peak_rss_bytes"])
+
+    def cache_stats(self):
+        """
+        Stats of the registered caches, with the hits and misses merged from other processes added in.
+        """
+        stats = {name: dict(cache.stats()) for name, cache in self.caches.items()}
+        with self._lock:
+            remote = {name: list(sources.values()) for name, sources in self.remote_caches.items()}
+        for name, sources in remote.items():
+            entry = stats.setdefault(name, {"hits": 0, "misses": 0})
+            entry["hits"] += sum(hits for hits, _ in sources)
+            entry["misses"] += sum(misses for _, misses in sources)
+            lookups = entry["hits"] + entry["misses"]
+            entry["hit_rate"] = entry["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def to_dict(self):
+        """
+        :return: JSON-serialisable snapshot: per-stage latency summary and counters, caches, memory.
+                 Percentiles are histogram estimates (see `Histogram.quantile`); mean and total are exact.
+        """
+        self.update_memory()
+        with self._lock:
+            stages = {
+                stage: {
+                    "calls": h.count,
+                    "errors": self.counters.get(("errors", stage), 0),
+                    "items": self.counters.get(("items", stage)),
+                    "total_seconds": round(h.sum, 6),
+                    "mean_ms": round(h.sum / h.count * 1000, 3) if h.count else 0.0,
+                    "p50_ms": round(h.quantile(0.5) * 1000, 3),
+                    "p95_ms": round(h.quantile(0.95) * 1000, 3),
+                    "p99_ms": round(h.quantile(0.99) * 1000, 3),
+                }
+                for stage, h in self.histograms.items()
+            }
+        return {
+            "stages": stages,
+            "caches": self.cache_stats(),
+            "peak_rss_bytes": self.peak_rss_bytes,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def dump(self, path):
+        """Writes the JSON snapshot to `path`."""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+
+    def to_prometheus(self):
+        """
+        :return: Metrics in the Prometheus text exposition format.
+        """
+        self.update_memory()
+        lines = [
+            f"# HELP {PREFIX}_stage_seconds Latency of instrumented pipeline stages.",
+            f"# TYPE {PREFIX}_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {h.sum}')
+                lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {h.count}')
+            for metric, help_text in (("items", "Items processed by a stage."), ("errors", "Stage calls that raised.")):
+                lines.append(f"# HELP {PREFIX}_stage_{metric}_total {help_text}")
+                lines.append(f"# TYPE {PREFIX}_stage_{metric}_total counter")
+                for (name, stage), value in sorted(self.counters.items()):
+                    if name == metric:
+                        lines.append(f'{PREFIX}_stage_{metric}_total{{stage="{stage}"}} {value}')
+
+        cache_stats = self.cache_stats()
+        for metric, kind in (("hits", "counter"), ("misses", "counter"), ("hit_rate", "gauge")):
+            name = f"{PREFIX}_cache_{metric}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# TYPE {name} {kind}")
+            for cache_name, stats in sorted(cache_stats.items()):
+                lines.append(f'{name}{{cache="{cache_name}"}} {stats[metric]}')
+
+        lines.append(f"# HELP {PREFIX}_peak_rss_bytes Resident memory high-water mark of the largest process.")
+        lines.append(f"# TYPE {PREFIX}_peak_rss_bytes gauge")
+        lines.append(f"{PREFIX}_peak_rss_bytes {self.peak_rss_bytes}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def enable(tracing=False):
+    """
+    Turns instrumentation on. With `tracing`, each instrumented call also opens an OpenTelemetry
+    span (requires the `opentelemetry-api` package and a configured tracer provider to export).
+    """
+    global _enabled, _tracer
+    _enabled = True
+    if tracing:
+        try:
+            from opentelemetry import trace
+            _tracer = trace.get_tracer("pdf-multimodal-search")
+        except ImportError:
+            warnings.warn("opentelemetry-api is not installed; recording metrics without spans.")
+
+
+def disable():
+    global _enabled, _tracer
+    _enabled = False
+    _tracer = None
+
+
+def is_enabled():
+    return _enabled
+
+
+def instrumented(stage, items=None):
+    """
+    Decorator recording the latency (and optionally an item count) of every call under `stage`.
+    :param stage: Stage name, e.g. "embed" or "vector_search".
+    :param items: Function called with the same arguments as the wrapped one, returning the number of items.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            error = True
+            start = time.perf_counter()
+            try:
+                with _tracer.start_as_current_span(stage) if _tracer is not None else nullcontext():
+                    result = func(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                registry.observe(stage, time.perf_counter() - start,
+                                 items=items(*args, **kwargs) if items is not None and not error else None,
+                                 error=error)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = registry.to_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = registry.to_json(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=9100, host="0.0.0.0"):
+    """
+    Serves /metrics (Prometheus text) and /metrics.json from a daemon thread.
+    :return: The running server (call `shutdown()` to stop it).
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,433 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from modules.point_ids import make_point_id
+from modules.instrumentation import instrumented
+
+
+class NumpyVectorIndex:
+    """
+    In-process alternative to VectorDBHandler for small-to-mid collections.
+    Embeddings live in one contiguous, L2-normalised float32 matrix: exact search is a single
+    matrix-vector product plus argpartition, larger collections can switch to an IVF coarse quantizer,
+    and saved indexes are reopened through np.memmap without copying.
+
+    On disk, saves are incremental: new rows are appended to the vector file and payload changes to a
+    JSON-lines log, so a save costs what changed since the last one. Only compaction rewrites the
+    files, as a new generation.
+    """
+
+    VECTORS_FILE = "vectors-{generation}.f32"
+    LOG_FILE = "payloads-{generation}.jsonl"
+    META_FILE = "meta.json"  # written last: it marks a save as complete
+    IVF_FILE = "ivf.npz"
+
+    def __init__(self, path=None, vector_size=384, ivf_threshold=50_000, nlist=None, nprobe=8, compact_ratio=0.25):
+        """
+        Initializes the index, loading it from `path` if one was saved there.
+        :param path: Directory used by `save`/`load` (None = memory only).
+        :param vector_size: Embedding dimension.
+        :param ivf_threshold: Number of points from which searches go through the IVF quantizer.
+        :param nlist: IVF cell count (None = 4 * sqrt(points)); setting it enables IVF regardless of size.
+        :param nprobe: IVF cells scanned per query.
+        :param compact_ratio: Fraction of deleted rows that triggers compaction.
+        """
+        self.path = Path(path) if path else None
+        self.vector_size = vector_size
+        self.ivf_threshold = ivf_threshold
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.compact_ratio = compact_ratio
+        self.version = 0  # bumped on every write; keys query result caches
+
+        self._vectors = np.empty((0, vector_size), dtype=np.float32)  # rows [0, _size) are in use
+        self._alive = np.empty(0, dtype=bool)
+        self._assignments = np.empty(0, dtype=np.int32)  # IVF cell of every row
+        self._size = 0
+        self._ids = []
+        self._payloads = []
+        self._row_of = {}  # point id -> row
+        self._doc_rows = {}  # document id -> set of rows
+        self._centroids = None
+        self._ivf_trained_size = 0
+
+        # Persistence state: rows and log bytes covered by the last save, and what changed since
+        self._generation = 0
+        self._saved_size = 0
+        self._saved_log_bytes = 0
+        self._unsaved_rows = set()
+        self._rewrite = True  # next save writes a new generation (nothing saved yet, or rows renumbered)
+        self._ivf_dirty = False
+
+        if self.path and (self.path / self.META_FILE).exists():
+            self.load()
+
+    make_point_id = staticmethod(make_point_id)
+
+    def _ensure_capacity(self, rows):
+        """
+        Grows the row buffers geometrically; also turns a read-only memmap into a writable in-RAM copy.
+        """
+        capacity = self._vectors.shape[0]
+        if capacity >= rows and self._vectors.flags.writeable:
+            return
+        new_capacity = max(rows, 2 * capacity, 1024)
+        vectors = np.empty((new_capacity, self.vector_size), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        assignments = np.zeros(new_capacity, dtype=np.int32)
+        assignments[:self._size] = self._assignments[:self._size]
+        self._vectors, self._alive, self._assignments = vectors, alive, assignments
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    @instrumented("vector_upsert", items=lambda self, chunks, *args, **kwargs: len(chunks))
+    def store_vectors(self, chunks, embeddings, document_id="default", metadata=None, batch_size=None, parallel=None,
+                      start_index=0):
+        """
+        Stores text chunks with their embeddings; same contract as VectorDBHandler.store_vectors.
+        `batch_size` and `parallel` are accepted for interface compatibility and ignored.
+        :return: List of point IDs, in chunk order.
+        """
+        if not chunks:
+            return []
+
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(chunks), self.vector_size))
+        point_ids = [self.make_point_id(document_id, start_index + i, chunk) for i, chunk in enumerate(chunks)]
+        self._ensure_capacity(self._size + len(chunks))
+
+        rows = []
+        for i, (point_id, chunk) in enumerate(zip(point_ids, chunks)):
+            payload = {**(metadata[i] if metadata else {}), "text": chunk, "document": document_id}
+            row = self._row_of.get(point_id)
+            if row is None:
+                row = self._size
+                self._size += 1
+                self._ids.append(point_id)
+                self._payloads.append(payload)
+                self._row_of[point_id] = row
+            else:
+                self._payloads[row] = payload
+            self._doc_rows.setdefault(document_id, set()).add(row)
+            rows.append(row)
+        self._unsaved_rows.update(rows)
+
+        rows = np.asarray(rows)
+        self._vectors[rows] = vectors
+        self._alive[rows] = True
+        if self._centroids is not None:
+            self._assignments[rows] = np.argmax(vectors @ self._centroids.T, axis=1)
+        self.version += 1
+        return point_ids
+
+    def _delete_rows(self, rows):
+        self.version += 1
+        for row in rows:
+            if not self._alive[row]:
+                continue
+            self._alive[row] = False
+            self._row_of.pop(self._ids[row], None)
+            self._doc_rows.get(self._payloads[row]["document"], set()).discard(row)
+            self._payloads[row] = None
+            self._unsaved_rows.add(row)
+        dead = self._size - int(self._alive[:self._size].sum())
+        if self._size and dead > self.compact_ratio * self._size:
+            self._compact()
+
+    @instrumented("vector_delete", items=lambda self, point_ids: len(point_ids))
+    def delete_points(self, point_ids):
+        """
+        Removes points by ID.
+        """
+        self._delete_rows([self._row_of[pid] for pid in point_ids if pid in self._row_of])
+
+    @instrumented("vector_delete_document")
+    def delete_document(self, document_id):
+        """
+        Removes every point belonging to `document_id`.
+        """
+        self._delete_rows(list(self._doc_rows.pop(document_id, set())))
+
+    def count(self, document_id=None):
+        """
+        Returns the number of stored points, optionally for a single document.
+        """
+        if document_id is not None:
+            return len(self._doc_rows.get(document_id, ()))
+        return int(self._alive[:self._size].sum())
+
+    def _compact(self):
+        """
+        Drops deleted rows, keeping the matrix contiguous.
+        """
+        keep = np.flatnonzero(self._alive[:self._size])
+        self._vectors = np.ascontiguousarray(self._vectors[keep])
+        self._assignments = self._assignments[keep].copy()
+        self._alive = np.ones(len(keep), dtype=bool)
+        self._ids = [self._ids[row] for row in keep]
+        self._payloads = [self._payloads[row] for row in keep]
+        self._size = len(keep)
+        self._row_of = {point_id: row for row, point_id in enumerate(self._ids)}
+        self._doc_rows = {}
+        for row, payload in enumerate(self._payloads):
+            self._doc_rows.setdefault(payload["document"], set()).add(row)
+        self._rewrite = True  # rows were renumbered
+        self._unsaved_rows.clear()
+        self._ivf_dirty = self._centroids is not None
+
+    def build_ivf(self, nlist=None, iterations=10, sample_size=100_000, seed=0):
+        """
+        Trains the IVF coarse quantizer (spherical k-means on a sample) and assigns every row to a cell.
+        :param nlist: Number of cells (None = the index setting, or 4 * sqrt(points)).
+        """
+        live = np.flatnonzero(self._alive[:self._size])
+        if len(live) == 0:
+            return
+        rng = np.random.default_rng(seed)
+        nlist = min(nlist or self.nlist or int(4 * np.sqrt(len(live))), len(live))
+        sample = self._vectors[rng.choice(live, size=min(sample_size, len(live)), replace=False)]
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]  # reseed empty cells
+            centroids = self._normalize(sums)
+
+        for start in range(0, self._size, 65536):  # bounded temporary (rows x nlist) score matrix
+            block = self._vectors[start:start + 65536][:self._size - start]
+            self._assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._ivf_trained_size = len(live)
+        self._ivf_dirty = True
+
+    def _candidate_rows(self, query_vector):
+        """
+        Rows to score exactly: all of them, or those in the `nprobe` closest IVF cells.
+        """
+        if self.nlist is None and self._size < self.ivf_threshold:
+            return None
+        if self._centroids is None or self._size > 2 * self._ivf_trained_size:
+            self.build_ivf()  # (re)train once the collection has doubled since the last training
+        cells = np.argsort(-(self._centroids @ query_vector))[:self.nprobe]
+        return np.flatnonzero(np.isin(self._assignments[:self._size], cells))
+
+    @instrumented("vector_search")
+    def search_by_vector(self, query_vector, top_k=5, document_id=None):
+        """
+        Top-k cosine search with an already computed query embedding.
+        :return: List of (text, score) tuples, highest similarity first.
+        """
+        if self._size == 0:
+            return []
+        query_vector = self._normalize(np.asarray(query_vector, dtype=np.float32))
+
+        rows = self._candidate_rows(query_vector)
+        if rows is None:
+            scores = self._vectors[:self._size] @ query_vector
+            valid = self._alive[:self._size].copy()
+            rows = np.arange(self._size)
+        else:
+            scores = self._vectors[rows] @ query_vector
+            valid = self._alive[rows]
+        if document_id is not None:
+            valid &= np.isin(rows, np.fromiter(self._doc_rows.get(document_id, ()), dtype=np.int64))
+
+        k = min(top_k, int(valid.sum()))
+        if k == 0:
+            return []
+        scores = np.where(valid, scores, -np.inf)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._payloads[rows[i]]["text"], float(scores[i])) for i in top]
+
+    @instrumented("vector_search_batch", items=lambda self, query_vectors, *args, **kwargs: len(query_vectors))
+    def search_by_vectors(self, query_vectors, top_k=5, document_id=None, block_size=256):
+        """
+        Batch variant of `search_by_vector`. Exact searches score a block of queries with one
+        matrix-matrix product; IVF searches are probed per query.
+        :return: List (one per query) of (text, score) tuples, highest similarity first.
+        """
+        query_vectors = self._normalize(np.asarray(query_vectors, dtype=np.float32).reshape(-1, self.vector_size))
+        if self._size == 0 or len(query_vectors) == 0:
+            return [[] for _ in range(len(query_vectors))]
+        if self.nlist is not None or self._size >= self.ivf_threshold:
+            return [self.search_by_vector(query_vector, top_k, document_id) for query_vector in query_vectors]
+
+        valid = self._alive[:self._size].copy()
+        if document_id is not None:
+            valid &= np.isin(np.arange(self._size), np.fromiter(self._doc_rows.get(document_id, ()), dtype=np.int64))
+        k = min(top_k, int(valid.sum()))
+        if k == 0:
+            return [[] for _ in range(len(query_vectors))]
+
+        results = []
+        for start in range(0, len(query_vectors), block_size):  # bounds the (block x points) score matrix
+            scores = query_vectors[start:start + block_size] @ self._vectors[:self._size].T
+            scores[:, ~valid] = -np.inf
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            for rows, row_scores in zip(np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)):
+                results.append([(self._payloads[row]["text"], float(score)) for row, score in zip(rows, row_scores)])
+        return results
+
+    def search_vectors_batch(self, query_texts, text_processor, top_k=5, document_id=None):
+        """
+        Searches for several queries at once with a single embedding call.
+        :return: List (one per query) of retrieved text chunks, sorted by highest similarity.
+        """
+        query_vectors = text_processor.embed_chunks(list(query_texts))
+        return [[text for text, _ in hits] for hits in self.search_by_vectors(query_vectors, top_k, document_id)]
+
+    def search_vectors(self, query_text, text_processor, top_k=5, document_id=None):
+        """
+        Searches for the most similar text chunks; same contract as VectorDBHandler.search_vectors.
+        :return: List of retrieved text chunks, sorted by highest similarity.
+        """
+        query_vector = text_processor.embed_query(query_text)
+        return [text for text, _ in self.search_by_vector(query_vector, top_k, document_id)]
+
+    def _files(self, generation):
+        return (self.path / self.VECTORS_FILE.format(generation=generation),
+                self.path / self.LOG_FILE.format(generation=generation))
+
+    def _log_record(self, row):
+        if not self._alive[row]:
+            return {"row": row, "deleted": True}
+        return {"row": row, "id": self._ids[row], "payload": self._payloads[row]}
+
+    def save(self):
+        """
+        Writes what changed since the last save to `path`: appended rows, in-place row updates and payload
+        log records, or a whole new generation after compaction; then the IVF state if it was retrained.
+        """
+        if self.path is None:
+            raise ValueError("NumpyVectorIndex has no path to save to.")
+        if not (self._rewrite or self._unsaved_rows or self._ivf_dirty):
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        previous_generation = self._generation
+
+        if self._rewrite:
+            if self._size != int(self._alive[:self._size].sum()):
+                self._compact()
+            self._generation += 1
+            vectors_path, log_path = self._files(self._generation)
+            self._vectors[:self._size].tofile(vectors_path)
+            with open(log_path, "wb") as f:
+                for row in range(self._size):
+                    f.write((json.dumps(self._log_record(row)) + "\n").encode("utf-8"))
+                log_bytes = f.tell()
+            self._ivf_dirty = self._centroids is not None
+            if self._size and not self._vectors.flags.writeable:
+                # Still mapped from the previous generation's file, which is deleted below
+                self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r",
+                                          shape=(self._size, self.vector_size))
+        else:
+            vectors_path, log_path = self._files(self._generation)
+            row_bytes = self.vector_size * 4
+            rows = sorted(self._unsaved_rows)
+            with open(vectors_path, "r+b") as f:
+                f.truncate(self._saved_size * row_bytes)  # drops rows of an interrupted save
+                for row in rows:
+                    if row < self._saved_size and self._alive[row]:
+                        f.seek(row * row_bytes)
+                        f.write(self._vectors[row].tobytes())
+                f.seek(self._saved_size * row_bytes)
+                self._vectors[self._saved_size:self._size].tofile(f)
+            with open(log_path, "r+b") as f:
+                f.truncate(self._saved_log_bytes)
+                f.seek(self._saved_log_bytes)
+                for row in rows:
+                    f.write((json.dumps(self._log_record(row)) + "\n").encode("utf-8"))
+                log_bytes = f.tell()
+
+        if self._ivf_dirty:
+            tmp_ivf = self.path / ("tmp_" + self.IVF_FILE)
+            np.savez(tmp_ivf, centroids=self._centroids, assignments=self._assignments[:self._size],
+                     trained_size=self._ivf_trained_size, generation=self._generation)
+            os.replace(tmp_ivf, self.path / self.IVF_FILE)
+
+        tmp_meta = self.path / (self.META_FILE + ".tmp")
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"vector_size": self.vector_size, "size": self._size, "generation": self._generation,
+                       "log_bytes": log_bytes}, f)
+        os.replace(tmp_meta, self.path / self.META_FILE)
+
+        self._saved_size = self._size
+        self._saved_log_bytes = log_bytes
+        self._unsaved_rows.clear()
+        self._rewrite = self._ivf_dirty = False
+        if self._generation != previous_generation:
+            for old_file in self._files(previous_generation):
+                if old_file.exists():
+                    old_file.unlink()
+
+    def flush(self):
+        """Persists the changes if the index has a path (called by IngestPipeline at each checkpoint)."""
+        if self.path is not None:
+            self.save()
+
+    def load(self):
+        """
+        Opens a saved index; the vector matrix is memory-mapped read-only until the first write.
+        """
+        with open(self.path / self.META_FILE, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["vector_size"] != self.vector_size:
+            raise ValueError(
+                f"Index at '{self.path}' stores {meta['vector_size']}-d vectors, expected {self.vector_size}-d."
+            )
+
+        self._size = meta["size"]
+        self._generation = meta["generation"]
+        vectors_path, log_path = self._files(self._generation)
+        self._ids = [None] * self._size
+        self._payloads = [None] * self._size
+        self._alive = np.zeros(self._size, dtype=bool)
+        with open(log_path, "rb") as f:
+            log = f.read(meta["log_bytes"])  # bytes past it belong to an interrupted save
+        for line in log.splitlines():
+            record = json.loads(line)
+            row = record["row"]
+            if record.get("deleted"):
+                self._alive[row] = False
+                self._payloads[row] = None
+            else:
+                self._alive[row] = True
+                self._ids[row] = record["id"]
+                self._payloads[row] = record["payload"]
+        self._saved_size = self._size
+        self._saved_log_bytes = meta["log_bytes"]
+        self._rewrite = False
+
+        if self._size:
+            self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(self._size, self.vector_size))
+        self._assignments = np.zeros(self._size, dtype=np.int32)
+        self._row_of = {point_id: row for row, point_id in enumerate(self._ids) if self._alive[row]}
+        self._doc_rows = {}
+        for row, payload in enumerate(self._payloads):
+            if self._alive[row]:
+                self._doc_rows.setdefault(payload["document"], set()).add(row)
+
+        ivf_path = self.path / self.IVF_FILE
+        if ivf_path.exists():
+            ivf = np.load(ivf_path)
+            saved = len(ivf["assignments"])
+            generation = int(ivf["generation"]) if "generation" in ivf.files else 0
+            if generation == self._generation and saved <= self._size:
+                self._centroids = ivf["centroids"]
+                self._assignments[:saved] = ivf["assignments"]
+                if saved < self._size:  # rows appended after the last training
+                    self._assignments[saved:] = np.argmax(self._vectors[saved:self._size] @ self._centroids.T, axis=1)
+                self._ivf_trained_size = int(ivf["trained_size"])
@@ -0,0 +1,14 @@
+import hashlib
+import uuid
+
+# Namespace for content-derived point IDs, so re-ingesting a document yields the same IDs
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2a4e-5b0d-4c1e-9a57-3f7e2d8b9c10")
+
+
+def make_point_id(document_id, chunk_index, chunk):
+    """
+    Builds a stable point ID from the document, the chunk position and the chunk text.
+    :return: UUID string (accepted by Qdrant and used as-is by the NumPy index).
+    """
+    chunk_hash = hashlib.sha1(chunk.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{document_id}:{chunk_index}:{chunk_hash}"))
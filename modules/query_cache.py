@@ -0,0 +1,69 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryResultCache:
+    """
+    In-memory LRU cache of QueryPipeline responses with a time-to-live.
+    Keys combine the normalized query, the pipeline configuration and the vector store version,
+    so any write to the collection makes older entries unreachable (they age out via LRU/TTL).
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600):
+        """
+        :param max_entries: Maximum number of cached responses.
+        :param ttl_seconds: Lifetime of an entry (None = no expiry).
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, response)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query):
+        """Case-folds, collapses whitespace and drops trailing punctuation, so trivial variants share an entry."""
+        return re.sub(r"\s+", " ", query).strip().rstrip("?!.").strip().casefold()
+
+    def make_key(self, query, config, version):
+        return self.normalize(query), config, version
+
+    def get(self, key):
+        """
+        Returns the cached response, or None on a miss or expired entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            response = entry[1]
+        return list(response) if isinstance(response, list) else response  # callers may mutate lists
+
+    def put(self, key, response):
+        with self._lock:
+            expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+            self._entries[key] = (expires_at, list(response) if isinstance(response, list) else response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
@@ -1,6 +1,8 @@
 """
 This class implements query pipeline handler to handle all the process components & steps.
 """
+from modules.bm25_index import reciprocal_rank_fusion
+from modules.instrumentation import instrumented
 
 
 class QueryPipeline:
@@ -8,7 +10,8 @@ class QueryPipeline:
     Handles query retrieval, re-ranking, and merging of responses.
     """
 
-    def __init__(self, text_processor, vector_db, reranker=None, t5_merger=None, ranker_method="cosine_similarity", merger_method="t5", top_k=5):
+    def __init__(self, text_processor, vector_db, reranker=None, t5_merger=None, ranker_method="cosine_similarity", merger_method="t5", top_k=5,
+                 bm25_index=None, retrieval_method="dense", hybrid_candidates=20, rrf_k=60, result_cache=None):
         """
         Initializes the query pipeline.
         
@@ -16,9 +19,14 @@ class QueryPipeline:
         :param vector_db: VectorDBHandler instance.
         :param reranker: ReRanker instance (Optional, depends on `ranker_method`).
         :param t5_merger: T5AnswerMerger instance (Optional, depends on `merger_method`).
-        :param ranker_method: Method for ranking results ("tfidf", "cosine_similarity", "none").
+        :param ranker_method: Method for ranking results ("tfidf", "cross_encoder", "cosine_similarity", "none").
         :param merger_method: Method for merging results ("t5", "concatenation").
         :param top_k: Number of retrieved text chunks.
+        :param bm25_index: BM25Index over the same chunks (Optional, needed for "hybrid").
+        :param retrieval_method: "dense" (vector search only) or "hybrid" (dense + BM25 fused with reciprocal rank fusion).
+        :param hybrid_candidates: Candidates taken from each retriever before fusion.
+        :param rrf_k: Reciprocal rank fusion constant.
+        :param result_cache: QueryResultCache for whole responses (Optional).
         """
         self.text_processor = text_processor
         self.vector_db = vector_db
@@ -27,32 +35,184 @@ class QueryPipeline:
         self.ranker_method = ranker_method
         self.merger_method = merger_method
         self.top_k = top_k
+        self.bm25_index = bm25_index
+        self.retrieval_method = retrieval_method
+        self.hybrid_candidates = hybrid_candidates
+        self.rrf_k = rrf_k
+        self.result_cache = result_cache
 
-    def process_query(self, query):
+    @property
+    def hybrid(self):
+        return self.retrieval_method == "hybrid" and self.bm25_index is not None
+
+    @property
+    def config_key(self):
+        """Settings that change the response; part of the result cache key."""
+        return (self.top_k, self.ranker_method, self.merger_method, self.retrieval_method if self.hybrid else "dense",
+                self.hybrid_candidates, self.rrf_k, self.retrieval_k,
+                self.t5_merger.preset if self.t5_merger else None)
+
+    def cache_key(self, query):
+        # The store version changes on every write, so ingest implicitly invalidates cached responses
+        return self.result_cache.make_key(query, self.config_key, self.vector_db.version)
+
+    @property
+    def reranking(self):
+        return self.ranker_method in ("tfidf", "cross_encoder") and self.reranker is not None
+
+    @property
+    def retrieval_k(self):
         """
-        Retrieves, re-ranks, and summarizes answers based on the query.
-        
-        :param query: The user's query.
-        :return: A structured response.
+        Candidates to retrieve: a cross-encoder gets a wide, cheap candidate set to rerank precisely.
+        """
+        if self.ranker_method == "cross_encoder" and self.reranker is not None:
+            return max(self.top_k, self.reranker.candidate_budget)
+        return self.top_k
+
+    def retrieve(self, query):
+        """
+        Retrieves `retrieval_k` candidate chunks for one query (dense or hybrid).
+        """
+        if self.hybrid:
+            dense_chunks = self.vector_db.search_vectors(query, self.text_processor, top_k=max(self.retrieval_k, self.hybrid_candidates))
+            return self.fuse(query, dense_chunks)
+        return self.vector_db.search_vectors(query, self.text_processor, top_k=self.retrieval_k)
+
+    def retrieve_batch(self, queries):
+        """
+        Batch variant of `retrieve`.
+        """
+        if self.hybrid:
+            dense = self.vector_db.search_vectors_batch(queries, self.text_processor, top_k=max(self.retrieval_k, self.hybrid_candidates))
+            return [self.fuse(query, chunks) for query, chunks in zip(queries, dense)]
+        return self.vector_db.search_vectors_batch(queries, self.text_processor, top_k=self.retrieval_k)
+
+    def fuse(self, query, dense_chunks):
+        """
+        Fuses dense results with BM25 results for the same query (reciprocal rank fusion).
+        """
+        lexical_chunks = [text for _, text, _ in self.bm25_index.search(query, top_k=self.hybrid_candidates)]
+        return reciprocal_rank_fusion([dense_chunks, lexical_chunks], top_k=self.retrieval_k, k=self.rrf_k)
+
+    def retrieve_ranked(self, query):
+        """
+        Retrieves and (optionally) re-ranks the chunks that feed the merger for one query.
         """
         # query_text_chunks = self.text_processor.chunk_text(query)
         # print("query: ", query, self.top_k)
         # query_embedding = self.text_processor.model.encode(query)
         # query_embedding = self.text_processor.embed_chunks([query])[0]
-        retrieved_chunks = self.vector_db.search_vectors(query, self.text_processor, top_k=self.top_k)
+        retrieved_chunks = self.retrieve(query)
 
         # Apply ranking if a method is set
-        if self.ranker_method == "tfidf" and self.reranker:
-            ranked_chunks = self.reranker.rerank(query, retrieved_chunks)
+        if self.reranking:
+            return self.reranker.rerank(query, retrieved_chunks)[:self.top_k]
         elif self.ranker_method == "cosine_similarity":
-            ranked_chunks = retrieved_chunks  # Already sorted by similarity from Qdrant
+            return retrieved_chunks  # Already sorted by similarity from Qdrant
         else:
-            ranked_chunks = retrieved_chunks  # No ranking applied
+            return retrieved_chunks  # No ranking applied
+
+    @instrumented("query")
+    def process_query(self, query):
+        """
+        Retrieves, re-ranks, and summarizes answers based on the query.
+        
+        :param query: The user's query.
+        :return: A structured response.
+        """
+        if self.result_cache is not None:
+            key = self.cache_key(query)
+            response = self.result_cache.get(key)
+            if response is None:
+                response = self._process_query(query)
+                self.result_cache.put(key, response)
+            return response
+        return self._process_query(query)
+
+    def _process_query(self, query):
+        ranked_chunks = self.retrieve_ranked(query)
 
         if self.merger_method == "t5" and self.t5_merger:
             # print(ranked_chunks)
-            return self.t5_merger.merge_and_summarize(ranked_chunks, query)
+            return self.t5_merger.merge_and_summarize(ranked_chunks, query=query)
         elif self.merger_method == "concatenation":
             return "\n".join(ranked_chunks)  # Simple concatenation of retrieved chunks
         else:
             return ranked_chunks  # Default return with the merging and reranking
+
+    def stream_query(self, query):
+        """
+        Streaming variant of `process_query`, for UIs that should show output before generation ends.
+        Yields `(kind, payload)` events:
+          ("chunks", ranked_chunks) as soon as retrieval and re-ranking finish,
+          ("token", text) for each piece of the T5 answer as it is generated,
+          ("answer", response) last, with the full response (also what `process_query` returns).
+        A cached response is yielded directly as a single "answer" event.
+        """
+        key = None
+        if self.result_cache is not None:
+            key = self.cache_key(query)
+            response = self.result_cache.get(key)
+            if response is not None:
+                yield "answer", response
+                return
+
+        ranked_chunks = self.retrieve_ranked(query)
+        yield "chunks", ranked_chunks
+
+        if self.merger_method == "t5" and self.t5_merger:
+            pieces = []
+            for piece in self.t5_merger.stream_merge(ranked_chunks, query=query):
+                pieces.append(piece)
+                yield "token", piece
+            response = "".join(pieces).strip()
+            if self.t5_merger.generation_kwargs().get("num_beams", 1) > 1:
+                key = None  # Streamed greedily; don't cache it as the beam-search answer
+        elif self.merger_method == "concatenation":
+            response = "\n".join(ranked_chunks)
+        else:
+            response = ranked_chunks
+
+        if key is not None:
+            self.result_cache.put(key, response)
+        yield "answer", response
+
+    @instrumented("query_batch", items=lambda self, queries, *args, **kwargs: len(queries))
+    def process_queries(self, queries, batch_size=64):
+        """
+        Batch variant of `process_query`: each step runs once per batch of queries
+        (one encode call, one vector-store batch search, one cross-encoder pass, batched T5 generation).
+
+        :param queries: List of user queries.
+        :param batch_size: Queries handled per step.
+        :return: List of responses, in query order, shaped like `process_query` results.
+        """
+        if self.result_cache is None:
+            return self._process_queries(queries, batch_size)
+
+        keys = [self.cache_key(query) for query in queries]
+        responses = [self.result_cache.get(key) for key in keys]
+        missing = [i for i, response in enumerate(responses) if response is None]
+        for i, response in zip(missing, self._process_queries([queries[i] for i in missing], batch_size)):
+            self.result_cache.put(keys[i], response)
+            responses[i] = response
+        return responses
+
+    def _process_queries(self, queries, batch_size):
+        responses = []
+        for start in range(0, len(queries), batch_size):
+            batch = list(queries[start:start + batch_size])
+            retrieved = self.retrieve_batch(batch)
+
+            if self.reranking:
+                ranked = [chunks[:self.top_k] for chunks in self.reranker.rerank_batch(batch, retrieved)]
+            else:
+                ranked = retrieved  # Already sorted by similarity from the vector store
+
+            if self.merger_method == "t5" and self.t5_merger:
+                responses.extend(self.t5_merger.merge_and_summarize_batch(ranked, queries=batch))
+            elif self.merger_method == "concatenation":
+                responses.extend("\n".join(chunks) for chunks in ranked)
+            else:
+                responses.extend(ranked)
+        return responses
@@ -1,32 +1,82 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
+import hashlib
+import time
+from collections import OrderedDict
 import numpy as np
+from modules.instrumentation import instrumented
+from modules.startup import LazyResource, profiler
 
 # Optional: I might rank based on TF-IDF 
 
 class ReRanker:
     """
-    Re-ranks retrieved text snippets using TF-IDF or an LLM-based approach.
+    Re-ranks retrieved text snippets using TF-IDF or a cross-encoder.
     """
 
-    def __init__(self, method="tfidf"):
+    def __init__(self, method="tfidf", model_name="cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size=32,
+                 candidate_budget=20, min_score=None, time_budget_ms=None, cache_size=10_000):
         """
         Initializes the ReRanker.
-        :param method: Ranking method - "tfidf" (default) or "llm".
+        :param method: Ranking method - "tfidf" (default) or "cross_encoder".
+        :param model_name: CrossEncoder model (cross_encoder only).
+        :param batch_size: Query-chunk pairs scored per forward pass (cross_encoder only).
+        :param candidate_budget: Maximum candidates scored per query; the rest keep their retrieval order after them.
+        :param min_score: Drop scored candidates below this cross-encoder score (None = keep all).
+        :param time_budget_ms: Stop scoring further batches once this much time is spent; unscored
+                               candidates keep their retrieval order (None = no limit).
+        :param cache_size: Number of (query, chunk) scores kept in the LRU score cache.
         """
+        self.method = method
+        self.last_timings = {}  # per-stage latency (ms) and counters of the latest rerank call
+
         if method == "tfidf": # we can add "llm" rerankers 
-            self.vectorizer = TfidfVectorizer()
+            self._model = LazyResource(self.load_vectorizer)
+        elif method == "cross_encoder":
+            self._model = LazyResource(lambda: self.load_cross_encoder(model_name))
+            self.batch_size = batch_size
+            self.candidate_budget = candidate_budget
+            self.min_score = min_score
+            self.time_budget_ms = time_budget_ms
+            self.cache_size = cache_size
+            self.score_cache = OrderedDict()  # (query hash, chunk id) -> score
         else:
-            raise NotImplementedError(f"Re-ranking method '{method}' is not implemented yet. Use 'tfidf'.")
+            raise NotImplementedError(
+                f"Re-ranking method '{method}' is not implemented yet. Use 'tfidf' or 'cross_encoder'."
+            )
+
+    @staticmethod
+    def load_vectorizer():
+        with profiler.measure("tfidf reranker", "import"):
+            from sklearn.feature_extraction.text import TfidfVectorizer
+        return TfidfVectorizer()
+
+    @staticmethod
+    def load_cross_encoder(model_name):
+        with profiler.measure("cross-encoder", "import"):
+            from sentence_transformers import CrossEncoder
+        with profiler.measure("cross-encoder", "load"):
+            return CrossEncoder(model_name)
+
+    @property
+    def vectorizer(self):
+        return self._model.get()
 
+    @property
+    def model(self):
+        """The cross-encoder, loaded on first use (or by `warmup`)."""
+        return self._model.get()
+
+    def warmup(self):
+        """Starts loading the ranking model in a background thread."""
+        return self._model.warmup()
 
     def rerank_by_tfidf(self, query, results):
         """
         Re-ranks search results based on TF-IDF similarity to the query.
         :param query: The user query.
-        :param results: List of (text, score) tuples from Qdrant.
+        :param results: List of text snippets (or (text, score) tuples) from the vector store.
         :return: Re-ranked list of text snippets.
         """
-        texts = [text for text, _ in results]  # Extract only texts
+        texts = [r[0] if isinstance(r, tuple) else r for r in results]  # Extract only texts
 
         if len(texts) == 0:
             return []  # No results to rank
@@ -44,12 +94,110 @@ class ReRanker:
         ranked_results = sorted(zip(texts, tfidf_scores), key=lambda x: x[1], reverse=True)
         return [text for text, _ in ranked_results]
 
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _score_pairs(self, pairs):
+        """
+        Scores (query, text) pairs with the cross-encoder, serving repeated pairs from the LRU cache.
+        Batches are scored in order until `time_budget_ms` runs out.
+        :return: List of scores aligned with `pairs`; None for pairs left unscored by the time budget.
+        """
+        start = time.perf_counter()
+        keys = [(self._hash(query), self._hash(text)) for query, text in pairs]
+        scores = [None] * len(pairs)
+        missing = []
+        for i, key in enumerate(keys):
+            if key in self.score_cache:
+                self.score_cache.move_to_end(key)
+                scores[i] = self.score_cache[key]
+            else:
+                missing.append(i)
+        lookup_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        scored = 0
+        for batch_start in range(0, len(missing), self.batch_size):
+            if self.time_budget_ms is not None and (time.perf_counter() - start) * 1000 >= self.time_budget_ms:
+                break  # early cutoff: keep the latency SLA, leave the rest in retrieval order
+            batch = missing[batch_start:batch_start + self.batch_size]
+            batch_scores = self.model.predict([pairs[i] for i in batch], batch_size=self.batch_size)
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+                self.score_cache[keys[i]] = scores[i]
+            scored += len(batch)
+        while len(self.score_cache) > self.cache_size:
+            self.score_cache.popitem(last=False)
+
+        self.last_timings = {
+            "cache_lookup_ms": round(lookup_ms, 3),
+            "score_ms": round((time.perf_counter() - start) * 1000, 3),
+            "pairs": len(pairs),
+            "cache_hits": len(pairs) - len(missing),
+            "scored": scored,
+        }
+        return scores
+
+    def _order_by_scores(self, texts, scores):
+        """
+        Sorts scored candidates by score (dropping those under `min_score`), then appends unscored ones.
+        """
+        scored = [(text, score) for text, score in zip(texts, scores) if score is not None]
+        if self.min_score is not None:
+            scored = [(text, score) for text, score in scored if score >= self.min_score]
+        scored.sort(key=lambda x: x[1], reverse=True)
+        return [text for text, _ in scored] + [text for text, score in zip(texts, scores) if score is None]
+
+    def rerank_by_cross_encoder(self, query, results):
+        """
+        Re-ranks search results with cross-encoder relevance scores.
+        :param query: The user query.
+        :param results: List of text snippets (or (text, score) tuples) from the vector store.
+        :return: Re-ranked list of text snippets; candidates beyond the budget follow in retrieval order.
+        """
+        return self.rerank_batch_by_cross_encoder([query], [results])[0]
+
+    def rerank_batch_by_cross_encoder(self, queries, results_per_query):
+        """
+        Scores the candidates of many queries with one pass over all their (query, chunk) pairs.
+        """
+        texts_per_query = [[r[0] if isinstance(r, tuple) else r for r in results] for results in results_per_query]
+        pairs = [(query, text) for query, texts in zip(queries, texts_per_query) for text in texts[:self.candidate_budget]]
+        scores = self._score_pairs(pairs)
+
+        start = time.perf_counter()
+        ranked, offset = [], 0
+        for texts in texts_per_query:
+            budget = texts[:self.candidate_budget]
+            ranked.append(self._order_by_scores(budget, scores[offset:offset + len(budget)]) + texts[self.candidate_budget:])
+            offset += len(budget)
+        self.last_timings["sort_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        return ranked
+
+    @instrumented("rerank", items=lambda self, query, results: len(results))
     def rerank(self, query, results):
         """
         Calls the appropriate reranking method based on the chosen approach.
         :param query: The user query.
-        :param results: List of (text, score) tuples.
+        :param results: List of text snippets (or (text, score) tuples).
         :return: Re-ranked text snippets.
         """
+        if self.method == "cross_encoder":
+            return self.rerank_by_cross_encoder(query, results)
         return self.rerank_by_tfidf(query, results)
 
+    @instrumented("rerank_batch", items=lambda self, queries, results_per_query: len(queries))
+    def rerank_batch(self, queries, results_per_query):
+        """
+        Re-ranks the candidates of many queries at once: a single cross-encoder pass over all pairs.
+        TF-IDF is fitted per query, exactly as `rerank` does, so batched and single queries rank alike
+        (and may share result cache entries); at top_k scale each fit is cheap.
+        :param queries: List of user queries.
+        :param results_per_query: List (one per query) of retrieved text snippets.
+        :return: List (one per query) of re-ranked text snippets.
+        """
+        if self.method == "cross_encoder":
+            return self.rerank_batch_by_cross_encoder(queries, results_per_query)
+        return [self.rerank_by_tfidf(query, results) for query, results in zip(queries, results_per_query)]
+
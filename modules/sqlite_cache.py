@@ -0,0 +1,173 @@
+import sqlite3
+import threading
+import time
+import warnings
+from pathlib import Path
+
+
+class SQLiteLRUCache:
+    """
+    Persistent key/value cache backed by a single SQLite table, with least-recently-used eviction
+    and per-process hit/miss counters. Thread-safe; shared by the caption and embedding caches.
+
+    The cache is best effort: SQLite errors (e.g. "database is locked" with many ingest workers on one
+    file) count as misses on reads and are ignored on writes. Hits only queue their access time, written
+    in batches, and the row count is tracked instead of counted per write; with several processes on one
+    file it can drift, which only makes eviction approximate.
+    """
+
+    table = "entries"
+    touch_batch = 256  # queued access times written per batch
+
+    def __init__(self, db_path, max_entries=100_000):
+        """
+        Opens (or creates) the cache database.
+        :param db_path: Path of the SQLite file.
+        :param max_entries: Maximum number of entries kept before LRU eviction.
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0  # compute time avoided by hits, based on the cost recorded at insert
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                cost REAL NOT NULL DEFAULT 0,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_last_access ON {self.table}(last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        self._touched = {}  # key -> last access time of hits not written yet
+
+    def get(self, key):
+        """
+        Returns the cached value for `key`, or None on a miss.
+        """
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys, chunk_size=500):
+        """
+        Looks up several keys at once.
+        :return: Dictionary of the keys that were found and their values.
+        """
+        found = {}
+        with self._lock:
+            try:
+                for start in range(0, len(keys), chunk_size):  # stay below SQLite's bound-parameter limit
+                    chunk = keys[start:start + chunk_size]
+                    rows = self._conn.execute(
+                        f"SELECT key, value, cost FROM {self.table} WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall()
+                    for key, value, cost in rows:
+                        found[key] = value
+                        self.saved_seconds += cost
+            except sqlite3.Error as e:
+                warnings.warn(f"{type(self).__name__} lookup failed, treating it as a miss: {e}")
+                found = {}
+
+            if found:
+                now = time.time()
+                self._touched.update((key, now) for key in found)
+                if len(self._touched) >= self.touch_batch:
+                    self._write(self._write_touches)
+
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put(self, key, value, cost=0.0):
+        """
+        Stores one value; `cost` is the compute time (seconds) a later hit saves.
+        """
+        self.put_many([(key, value, cost)])
+
+    def put_many(self, items, chunk_size=500):
+        """
+        Stores several (key, value, cost) tuples and evicts the least recently used entries beyond `max_entries`.
+        """
+        items = list(items)
+
+        def write():
+            keys = list({key for key, _, _ in items})
+            existing = 0
+            for start in range(0, len(keys), chunk_size):
+                chunk = keys[start:start + chunk_size]
+                existing += self._conn.execute(
+                    f"SELECT COUNT(*) FROM {self.table} WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchone()[0]
+            now = time.time()
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, cost, last_access) VALUES (?, ?, ?, ?)",
+                [(key, value, cost, now) for key, value, cost in items],
+            )
+            self._write_touches()  # queued hits share this transaction
+            count = self._count + len(keys) - existing
+            overflow = count - self.max_entries
+            if overflow > 0:
+                count -= self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,),
+                ).rowcount
+            return count
+
+        with self._lock:
+            count = self._write(write)
+            if count is not None:
+                self._count = count
+
+    def _write_touches(self):
+        if self._touched:
+            self._conn.executemany(f"UPDATE {self.table} SET last_access = ? WHERE key = ?",
+                                   [(now, key) for key, now in self._touched.items()])
+            self._touched = {}
+
+    def _write(self, write):
+        """
+        Runs `write` in one transaction (lock held); a failure is rolled back and ignored.
+        :return: What `write` returned, or None on failure.
+        """
+        try:
+            result = write()
+            self._conn.commit()
+            return result
+        except sqlite3.Error as e:
+            self._conn.rollback()
+            self._touched = {}
+            warnings.warn(f"{type(self).__name__} write failed, skipping it: {e}")
+            return None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self):
+        """
+        Returns hit/miss counters for this process.
+        :return: Dictionary with hits, misses, hit_rate, saved_seconds and entries.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "entries": len(self),
+        }
+
+    def close(self):
+        with self._lock:
+            self._write(self._write_touches)
+            self._conn.close()
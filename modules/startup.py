@@ -0,0 +1,82 @@
+"""
+Cold-start helpers: lazily loaded resources with optional background warmup, and a per-component
+timing report of imports and model loads (`main.py --profile-startup`).
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class StartupProfiler:
+    """
+    Accumulates wall-clock seconds per (component, phase), e.g. ("embedding", "import").
+    """
+
+    def __init__(self):
+        self.timings = defaultdict(float)
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def measure(self, component, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.timings[(component, phase)] += time.perf_counter() - start
+
+    def report(self):
+        """
+        :return: Table of seconds per component, one row per component with its import and load time.
+        """
+        with self._lock:
+            timings = dict(self.timings)
+        components = list(dict.fromkeys(component for component, _ in timings))
+        rows = [f"{'component':<16}{'import s':>10}{'load s':>10}"]
+        for component in components:
+            rows.append(f"{component:<16}{timings.get((component, 'import'), 0.0):>10.3f}"
+                        f"{timings.get((component, 'load'), 0.0):>10.3f}")
+        rows.append(f"{'total elapsed':<16}{time.perf_counter() - self._start:>20.3f}")
+        return "\n".join(rows)
+
+
+# Process-wide profiler used by the modules; loads in background threads are recorded too
+profiler = StartupProfiler()
+
+
+class LazyResource:
+    """
+    Calls `loader` once, on first `get()`; concurrent callers wait for the same load.
+    `warmup()` starts the load in a background thread so it overlaps other startup work.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._value = self._loader()
+                    self._loaded = True
+        return self._value
+
+    def warmup(self):
+        """
+        Starts loading in a daemon thread (no-op if already loaded).
+        :return: The thread, or None.
+        """
+        if self._loaded:
+            return None
+        thread = threading.Thread(target=self.get, daemon=True)
+        thread.start()
+        return thread
@@ -1,11 +1,13 @@
+import json
 import re
-from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List 
-from flair.models import SequenceTagger
-from flair.data import Sentence
-from flair.splitter import SegtokSentenceSplitter
+import time
+from pathlib import Path
+import numpy as np
 from typing import Dict, List
+from modules.embedding_cache import EmbeddingCache
+from modules.instrumentation import instrumented
+from modules.startup import LazyResource, profiler
+# sentence-transformers, langchain and flair are imported on first use: they dominate cold start
 # nltk.download('punkt')
 
 
@@ -14,13 +16,174 @@ class TextProcessor:
     Handles text processing, chunking[optional], and embedding generation.
     """
 
-    def __init__(self, embedding_model="all-MiniLM-L6-v2"):
+    # Embedding backends: PyTorch, ONNX Runtime fp32, and ONNX Runtime with int8 dynamic quantization
+    BACKENDS = ("torch", "onnx", "onnx-int8")
+    # Quantized export shipped in the Hub repos of the sentence-transformers models (x86 with AVX-512 VNNI);
+    # use e.g. "onnx/model_qint8_avx2.onnx" or "onnx/model_qint8_arm64.onnx" on other CPUs
+    DEFAULT_INT8_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+    def __init__(self, embedding_model="all-MiniLM-L6-v2", cache: EmbeddingCache = None, batch_size=64,
+                 backend="torch", num_threads=None, onnx_file_name=None):
         """
         Initializes text processor with an embedding model.
         :param embedding_model: Name of the SentenceTransformer model.
+        :param cache: Optional EmbeddingCache shared by ingest and query paths.
+        :param batch_size: Texts per forward pass when encoding.
+        :param backend: "torch", "onnx" or "onnx-int8".
+        :param num_threads: CPU threads used for inference (None = library default).
+        :param onnx_file_name: ONNX file inside the model repo (overrides the backend's default file).
+        """
+        if backend not in self.BACKENDS:
+            raise NotImplementedError(f"Embedding backend '{backend}' is not implemented. Use one of {self.BACKENDS}.")
+
+        self.embedding_model = embedding_model
+        self.backend = backend
+        # Cache and manifest key: quantized vectors (and other ONNX exports) differ slightly from fp32 ones
+        self.model_id = embedding_model if backend == "torch" else f"{embedding_model}@{backend}"
+        if backend != "torch" and onnx_file_name:
+            self.model_id += f":{onnx_file_name}"
+        self.cache = cache
+        self.batch_size = batch_size
+        self._model = LazyResource(lambda: self.load_model(embedding_model, backend, num_threads, onnx_file_name))
+        self._tokenizer = LazyResource(self.load_tokenizer)
+        self._splitter = LazyResource(self.load_splitter)
+
+    @property
+    def model(self):
+        """The SentenceTransformer, loaded on first use (or by `warmup`)."""
+        return self._model.get()
+
+    @property
+    def splitter(self):
+        return self._splitter.get()
+
+    def warmup(self):
+        """Starts loading the embedding model in a background thread."""
+        return self._model.warmup()
+
+    @property
+    def tokenizer(self):
+        """
+        The embedding model's tokenizer (for token-aware chunking). Loaded on its own while the model is not,
+        so building a chunker doesn't load the weights.
+        """
+        if self._model.loaded:
+            return self.model.tokenizer
+        return self._tokenizer.get()
+
+    @property
+    def max_seq_length(self):
+        """Tokens the embedding model reads; longer inputs are truncated (from its config when not loaded)."""
+        if not self._model.loaded:
+            config = self.read_model_file("sentence_bert_config.json")
+            if config and config.get("max_seq_length"):
+                return config["max_seq_length"]
+        return self.model.max_seq_length
+
+    @property
+    def model_path(self):
+        """Local directory or Hub repo id of the model; bare names resolve as SentenceTransformer does."""
+        if Path(self.embedding_model).is_dir() or "/" in self.embedding_model:
+            return self.embedding_model
+        return f"sentence-transformers/{self.embedding_model}"
+
+    def load_tokenizer(self):
+        """Loads only the tokenizer files of the model, falling back to the model's tokenizer."""
+        try:
+            with profiler.measure("tokenizer", "load"):
+                from transformers import AutoTokenizer
+                return AutoTokenizer.from_pretrained(self.model_path)
+        except Exception:
+            return self.model.tokenizer
+
+    @property
+    def dimension(self):
+        """
+        Size of the vectors produced by the embedding model. Read from the model's module configs while
+        the weights are not loaded, so sizing the vector store doesn't wait for (or undo) a lazy load.
         """
-        self.model = SentenceTransformer(embedding_model)
-        self.splitter = SegtokSentenceSplitter()
+        if not self._model.loaded:
+            dimension = self.config_dimension()
+            if dimension:
+                return dimension
+        return self.model.get_sentence_embedding_dimension()
+
+    def read_model_file(self, file_name):
+        """
+        Parses a small JSON file of the model (a local directory or a Hub repo, via the Hugging Face cache).
+        :return: The parsed JSON, or None if it can't be read.
+        """
+        try:
+            if Path(self.model_path).is_dir():
+                path = Path(self.model_path) / file_name
+            else:
+                from huggingface_hub import hf_hub_download
+                path = hf_hub_download(self.model_path, file_name)
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def config_dimension(self):
+        """
+        Output dimension according to the model's sentence-transformers modules (pooling, then any dense
+        projection), without loading weights.
+        :return: The dimension, or None if the configs don't determine it.
+        """
+        modules = self.read_model_file("modules.json")
+        if not modules:
+            return None
+        dimension = None
+        for module in modules:
+            kind = module.get("type", "").rsplit(".", 1)[-1]
+            if kind not in ("Pooling", "Dense"):
+                continue
+            config = self.read_model_file(f"{module['path']}/config.json")
+            if config is None:
+                return None
+            if kind == "Pooling":
+                # Enabled pooling modes are concatenated
+                modes = sum(1 for key, value in config.items() if key.startswith("pooling_mode_") and value is True)
+                dimension = config["word_embedding_dimension"] * max(modes, 1)
+            else:
+                dimension = config["out_features"]
+        return dimension
+
+    @staticmethod
+    def load_splitter():
+        with profiler.measure("sentence splitter", "import"):
+            from flair.splitter import SegtokSentenceSplitter
+        with profiler.measure("sentence splitter", "load"):
+            return SegtokSentenceSplitter()
+
+    @classmethod
+    def load_model(cls, embedding_model, backend="torch", num_threads=None, onnx_file_name=None):
+        """
+        Loads the SentenceTransformer with the requested inference backend.
+        :return: SentenceTransformer instance.
+        """
+        with profiler.measure("embedding", "import"):
+            from sentence_transformers import SentenceTransformer
+
+        if backend == "torch":
+            if num_threads:
+                import torch
+                torch.set_num_threads(num_threads)
+            with profiler.measure("embedding", "load"):
+                return SentenceTransformer(embedding_model)
+
+        model_kwargs = {"provider": "CPUExecutionProvider"}
+        file_name = onnx_file_name or (cls.DEFAULT_INT8_FILE if backend == "onnx-int8" else None)
+        if file_name:
+            model_kwargs["file_name"] = file_name
+        if num_threads:
+            import onnxruntime
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = num_threads
+            session_options.inter_op_num_threads = 1
+            model_kwargs["session_options"] = session_options
+        with profiler.measure("embedding", "load"):
+            return SentenceTransformer(embedding_model, backend="onnx", model_kwargs=model_kwargs)
 
     def build_text_document(self, structured_data):
         """
@@ -37,19 +200,44 @@ class TextProcessor:
                 document_text.append(f"Image Caption: {caption}")
         return "\n\n".join(document_text)
 
+    @staticmethod
+    def item_text(item):
+        """
+        Returns the text to embed for one parsed content entry, or None if it has nothing to embed.
+        """
+        if item["type"] == "text":
+            return item["text"]
+        elif item["type"] == "image" and item.get("caption"):
+            return item["caption"]  # Uncaptioned images have nothing to embed
+        return None
+
+    @staticmethod
+    def item_metadata(item, element_index):
+        """
+        Returns the payload metadata stored alongside one content entry.
+        """
+        return {"type": item["type"], "page": item.get("page"), "element_index": element_index}
+
     def extract_text_items(self, structured_data: Dict):
-        content = structured_data["content"]
         items = []
-        for item in content:
-            if item["type"] == "text":
-                items.append(item["text"])
-            elif item["type"] == "image":
-                items.append(item.get("caption", ""))
+        for item in structured_data["content"]:
+            text = self.item_text(item)
+            if text is not None:
+                items.append(text)
         
         return items
 
-            
-
+    def extract_item_metadata(self, structured_data: Dict):
+        """
+        Returns payload metadata for every item kept by `extract_text_items`, in the same order.
+        :param structured_data: The parsed document JSON.
+        :return: List of dicts with the element type, page and position in the document.
+        """
+        return [
+            self.item_metadata(item, element_index)
+            for element_index, item in enumerate(structured_data["content"])
+            if self.item_text(item) is not None
+        ]
 
     def chunk_text(self, text, chunk_size=500, chunk_overlap=50, method="recursive"):
         """
@@ -60,6 +248,7 @@ class TextProcessor:
    
 
         if method == "recursive":
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
             splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
             return splitter.split_text(text)
 
@@ -84,35 +273,76 @@ class TextProcessor:
 
 
     def semantic_splitter(self, text: str, chunk_size: int = 1000, chunk_overlap: int = 10) -> List[str]:
-     
-        
-        
-        # Split text into sentences
-        sentences = self.splitter.split(text)
+        """
+        Packs whole sentences into chunks of at most `chunk_size` characters; each chunk starts with
+        the trailing sentences of the previous one, up to `chunk_overlap` characters.
+        """
+        # Split text into sentences (plain strings extracted once)
+        sentences = [sentence.to_plain_string() for sentence in self.splitter.split(text)]
 
         chunks = []
-        current_chunk = ""
+        current, current_length = [], 0  # sentences of the open chunk and their joined length
 
         for sentence in sentences:
-            # Add sentence to the current chunk
-            if len(current_chunk) + len(sentence.to_plain_string()) <= chunk_size:
-                current_chunk += " " + sentence.to_plain_string()
-            else:
-                # If adding the next sentence exceeds max size, start a new chunk
-                chunks.append(current_chunk.strip())
-                current_chunk = sentence.to_plain_string()
+            if current and current_length + 1 + len(sentence) > chunk_size:
+                # If adding the next sentence exceeds max size, start a new chunk seeded with the overlap
+                chunks.append(" ".join(current))
+                overlap, overlap_length = [], 0
+                for previous in reversed(current):
+                    if overlap_length + len(previous) + 1 > chunk_overlap:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_length += len(previous) + 1
+                while overlap and overlap_length + len(sentence) > chunk_size:  # overlap never pushes past the size
+                    overlap_length -= len(overlap.pop(0)) + 1
+                current, current_length = overlap, max(overlap_length - 1, 0)
+            current_length += len(sentence) + (1 if current else 0)
+            current.append(sentence)
 
         # Add the last chunk if it exists
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+        if current:
+            chunks.append(" ".join(current))
 
         return chunks
 
 
-    def embed_chunks(self, chunks):
+    @instrumented("embed", items=lambda self, chunks, *args, **kwargs: len(chunks))
+    def embed_chunks(self, chunks, batch_size=None):
         """
         Converts text chunks into vector embeddings.
+        Cached and repeated texts are encoded once; the rest go to the model in a single call, where
+        SentenceTransformer length-sorts them into `batch_size` batches to minimise padding.
         :param chunks: List of text chunks.
-        :return: List of embeddings.
+        :param batch_size: Texts per forward pass (defaults to the processor setting).
+        :return: float32 array of shape (len(chunks), dimension).
+        """
+        if not chunks:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        unique_texts = list(dict.fromkeys(chunks))  # repeated boilerplate is encoded once
+        vectors = {}
+        if self.cache is not None:
+            keys = {text: self.cache.make_key(text, self.model_id) for text in unique_texts}
+            cached = self.cache.get_embeddings(list(keys.values()))
+            vectors = {text: cached[key] for text, key in keys.items() if key in cached}
+
+        missing = [text for text in unique_texts if text not in vectors]
+        if missing:
+            start = time.perf_counter()
+            encoded = self.model.encode(
+                missing, batch_size=batch_size or self.batch_size, convert_to_numpy=True
+            ).astype(np.float32, copy=False)
+            if self.cache is not None:
+                seconds_per_item = (time.perf_counter() - start) / len(missing)
+                self.cache.put_embeddings([keys[text] for text in missing], encoded, seconds_per_item)
+            vectors.update(zip(missing, encoded))
+
+        # Fully cached calls (e.g. repeated queries) never touch, or load, the model
+        return np.stack([vectors[text] for text in chunks]).astype(np.float32, copy=False)
+
+    def embed_query(self, query):
+        """
+        Embeds a single query through the same cache as ingest.
+        :return: float32 vector.
         """
-        return self.model.encode(chunks, convert_to_tensor=False).tolist()
+        return self.embed_chunks([query])[0]
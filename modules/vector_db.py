@@ -1,63 +1,250 @@
 import qdrant_client
 import numpy as np
-from qdrant_client.models import VectorParams, PointStruct
+from qdrant_client.models import (
+    VectorParams, PointStruct, PayloadSchemaType, Filter, FieldCondition, MatchValue, FilterSelector, PointIdsList,
+    Distance, HnswConfigDiff, ScalarQuantization, ScalarQuantizationConfig, ScalarType, BinaryQuantization,
+    BinaryQuantizationConfig, SearchParams, QuantizationSearchParams, SearchRequest
+)
+from modules.point_ids import make_point_id
+from modules.instrumentation import instrumented
 
 class VectorDBHandler:
     """
     Handles interaction with Qdrant (Vector Database).
     """
 
-    def __init__(self, collection_name="pdf_queries"):
+    # Payload fields indexed for filtering
+    PAYLOAD_INDEXES = {
+        "document": PayloadSchemaType.KEYWORD,
+        "type": PayloadSchemaType.KEYWORD,
+        "page": PayloadSchemaType.INTEGER,
+    }
+
+    def __init__(self, collection_name="pdf_queries", path=None, url=None, recreate=False, vector_size=384,
+                 quantization=None, hnsw_m=None, hnsw_ef_construct=None, on_disk=False,
+                 search_ef=None, rescore=True, oversampling=2.0):
         """
         Initializes Qdrant vector storage.
+        Quantization and HNSW settings take effect on a Qdrant server; local mode (path / in-memory) searches exhaustively.
+
         :param collection_name: Name of the Qdrant collection.
+        :param path: Directory for persistent local storage (None = in-memory).
+        :param url: URL of a Qdrant server; takes precedence over `path`.
+        :param recreate: Drop and recreate the collection even if it already exists.
+        :param vector_size: Embedding dimension; pass `text_processor.dimension` to match the embedding model.
+        :param quantization: None, "scalar" (int8) or "binary"; quantized vectors are kept in RAM, originals follow `on_disk`.
+        :param hnsw_m: HNSW graph degree (None = server default).
+        :param hnsw_ef_construct: HNSW build-time candidate list size (None = server default).
+        :param on_disk: Keep original vectors, HNSW graph and payloads on disk instead of RAM.
+        :param search_ef: HNSW search-time candidate list size (None = server default).
+        :param rescore: With quantization, re-score the oversampled candidates with the original vectors.
+        :param oversampling: Candidates fetched per requested result before rescoring.
         """
-        self.client = qdrant_client.QdrantClient(":memory:")  # Use local storage
+        if quantization == "none":
+            quantization = None  # CLI spelling of "no quantization"
+        if url:
+            self.client = qdrant_client.QdrantClient(url=url)
+        elif path:
+            self.client = qdrant_client.QdrantClient(path=str(path))  # Persistent local storage
+        else:
+            self.client = qdrant_client.QdrantClient(":memory:")  # Use local storage
         self.collection_name = collection_name
+        self.version = 0  # bumped on every write made through this handler; keys query result caches
+        self.vector_size = vector_size
 
-        self.client.recreate_collection(
-            collection_name=self.collection_name,
-            vectors_config=VectorParams(size=384, distance="Cosine") # cosine similarity and 
+        exists = self.client.collection_exists(self.collection_name)
+        if exists and recreate:
+            self.client.delete_collection(self.collection_name)
+            exists = False
+
+        # Existing collections are reopened as-is, so a pre-built corpus needs no re-ingest
+        quantized = quantization is not None
+        if not exists:
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=on_disk), # cosine similarity
+                hnsw_config=HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct, on_disk=on_disk),
+                quantization_config=self.quantization_config(quantization),
+                on_disk_payload=on_disk
+            )
+            for field_name, field_schema in self.PAYLOAD_INDEXES.items():
+                self.client.create_payload_index(self.collection_name, field_name=field_name, field_schema=field_schema)
+        else:
+            config = self.client.get_collection(self.collection_name).config
+            # The stored quantization decides the search params; the argument only applies to new collections
+            quantized = config.quantization_config is not None
+            stored_size = config.params.vectors.size
+            if stored_size != vector_size:
+                raise ValueError(
+                    f"Collection '{self.collection_name}' stores {stored_size}-d vectors but the embedding model "
+                    f"produces {vector_size}-d ones. Use another collection or recreate=True."
+                )
+
+        self.search_params = SearchParams(
+            hnsw_ef=search_ef,
+            quantization=QuantizationSearchParams(rescore=rescore, oversampling=oversampling) if quantized else None
         )
 
-    def store_vectors(self, chunks, embeddings):
+    @staticmethod
+    def quantization_config(quantization):
+        """
+        Maps a quantization name to its Qdrant config.
+        :param quantization: None, "scalar" or "binary".
+        """
+        if quantization in (None, "none"):
+            return None
+        elif quantization == "scalar":
+            return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+        elif quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        raise NotImplementedError(f"Quantization '{quantization}' is not implemented. Use 'scalar' or 'binary'.")
+
+    make_point_id = staticmethod(make_point_id)
+
+    @instrumented("vector_upsert", items=lambda self, chunks, *args, **kwargs: len(chunks))
+    def store_vectors(self, chunks, embeddings, document_id="default", metadata=None, batch_size=256, parallel=1,
+                      start_index=0):
         """
         Stores text chunks in Qdrant with embeddings.
         :param chunks: List of text chunks.
         :param embeddings: Corresponding embeddings.
+        :param document_id: Identifier of the source document, used to derive point IDs and stored in the payload.
+        :param metadata: Optional list of per-chunk payload dicts (e.g. page, type), aligned with `chunks`.
+        :param batch_size: Number of points sent per upsert request.
+        :param parallel: Number of parallel upload workers (1 = sequential batched upserts).
+        :param start_index: Position of the first chunk in the document, when storing a document in pieces.
+        :return: List of point IDs, in chunk order.
+        """
+        points = [
+            PointStruct(
+                id=self.make_point_id(document_id, start_index + i, chunk),
+                vector=np.asarray(vector, dtype=np.float32).tolist(),
+                payload={**(metadata[i] if metadata else {}), "text": chunk, "document": document_id}
+            )
+            for i, (chunk, vector) in enumerate(zip(chunks, embeddings))
+        ]
+
+        if parallel > 1:
+            self.client.upload_points(
+                collection_name=self.collection_name,
+                points=points,
+                batch_size=batch_size,
+                parallel=parallel,
+                wait=True
+            )
+        else:
+            for start in range(0, len(points), batch_size):
+                self.client.upsert(
+                    collection_name=self.collection_name,
+                    points=points[start:start + batch_size]
+                )
+        self.version += 1
+        return [point.id for point in points]
+
+    @staticmethod
+    def document_filter(document_id):
+        """Builds a Qdrant filter matching all points of one document."""
+        return Filter(must=[FieldCondition(key="document", match=MatchValue(value=document_id))])
+
+    @instrumented("vector_delete_document")
+    def delete_document(self, document_id):
+        """
+        Removes every point belonging to `document_id`.
+        """
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=FilterSelector(filter=self.document_filter(document_id))
+        )
+        self.version += 1
+
+    @instrumented("vector_delete", items=lambda self, point_ids: len(point_ids))
+    def delete_points(self, point_ids):
+        """
+        Removes points by ID.
         """
-        for i, (chunk, vector) in enumerate(zip(chunks, embeddings)):
-            self.client.upsert(
+        if point_ids:
+            self.client.delete(
                 collection_name=self.collection_name,
-                points=[
-                    PointStruct(
-                        id=np.random.randint(1e6),
-                        vector=vector,
-                        payload={"text": chunk}
-                    )
-                ]
+                points_selector=PointIdsList(points=list(point_ids))
             )
-    def search_vectors(self, query_text, text_processor, top_k=5):
+            self.version += 1
+
+    def count(self, document_id=None):
+        """
+        Returns the number of stored points, optionally for a single document.
+        """
+        count_filter = self.document_filter(document_id) if document_id else None
+        return self.client.count(self.collection_name, count_filter=count_filter, exact=True).count
+
+    def flush(self):
+        """
+        Makes stored points durable. Qdrant persists on every write, so there is nothing to do.
+        """
+
+    def search_vectors(self, query_text, text_processor, top_k=5, document_id=None):
         """
         Searches Qdrant for multiple relevant text chunks and ranks them by highest cosine similarity.
         
         :param query_text: User query.
         :param text_processor: Instance of TextProcessor.
         :param top_k: Number of retrieved documents.
+        :param document_id: Restrict the search to one document (None = whole collection).
         :return: List of retrieved text chunks, sorted by highest similarity.
         """
-        query_vector = text_processor.model.encode(query_text).tolist()
-        
+        query_vector = text_processor.embed_query(query_text)
+        return [text for text, _ in self.search_by_vector(query_vector, top_k, document_id)]
+
+    @instrumented("vector_search")
+    def search_by_vector(self, query_vector, top_k=5, document_id=None):
+        """
+        Searches Qdrant with an already computed query embedding.
+        :return: List of (text, score) tuples, highest similarity first.
+        """
         results = self.client.search(
             collection_name=self.collection_name,
-            query_vector=query_vector,
+            query_vector=np.asarray(query_vector, dtype=np.float32).tolist(),
+            query_filter=self.document_filter(document_id) if document_id else None,
+            search_params=self.search_params,
             limit=top_k
         )
         
         # Sort results based on similarity score (descending order)
         ranked_results = sorted(results, key=lambda hit: hit.score, reverse=True)
 
-        return [hit.payload["text"] for hit in ranked_results]
+        return [(hit.payload["text"], hit.score) for hit in ranked_results]
+
+    def search_vectors_batch(self, query_texts, text_processor, top_k=5, document_id=None):
+        """
+        Searches for several queries at once: one embedding call and one Qdrant batch request.
+        :return: List (one per query) of retrieved text chunks, sorted by highest similarity.
+        """
+        query_vectors = text_processor.embed_chunks(list(query_texts))
+        return [[text for text, _ in hits] for hits in self.search_by_vectors(query_vectors, top_k, document_id)]
+
+    @instrumented("vector_search_batch", items=lambda self, query_vectors, *args, **kwargs: len(query_vectors))
+    def search_by_vectors(self, query_vectors, top_k=5, document_id=None):
+        """
+        Batch variant of `search_by_vector`, sent to Qdrant as a single search_batch request.
+        :return: List (one per query) of (text, score) tuples, highest similarity first.
+        """
+        query_filter = self.document_filter(document_id) if document_id else None
+        requests = [
+            SearchRequest(
+                vector=np.asarray(query_vector, dtype=np.float32).tolist(),
+                filter=query_filter,
+                params=self.search_params,
+                limit=top_k,
+                with_payload=True
+            )
+            for query_vector in query_vectors
+        ]
+        if not requests:
+            return []
+        batch_results = self.client.search_batch(collection_name=self.collection_name, requests=requests)
+        return [
+            [(hit.payload["text"], hit.score) for hit in sorted(results, key=lambda hit: hit.score, reverse=True)]
+            for results in batch_results
+        ]
 
     # def search_multi_chunks(self, query_text, text_processor, top_k=5):
     #     """
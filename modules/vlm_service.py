@@ -1,37 +1,162 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from modules.caption_cache import CaptionCache
+from modules.instrumentation import instrumented
+
+
+@dataclass
+class CaptionResult:
+    """
+    Outcome of a single captioning request.
+    Exactly one of `caption` / `error` is set, so failures never masquerade as captions.
+    """
+    caption: Optional[str] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+
+    @property
+    def ok(self):
+        return self.caption is not None
+
 
 class VLMService:
     """
     Handles communication with the Vision-Language Model (Qwen2.5-VL).
     """
 
-    def __init__(self, api_url="http://localhost:8000/caption_image"):
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, api_url="http://localhost:8000/caption_image", timeout=60.0, max_retries=3,
+                 backoff_factor=0.5, pool_maxsize=16, max_concurrency=8,
+                 cache: Optional[CaptionCache] = None, model_id="Qwen/Qwen2.5-VL-7B-Instruct-AWQ"):
         """
         Initializes the VLMService with the given API endpoint.
         :param api_url: The URL of the VLM model server.
+        :param timeout: Per-request timeout in seconds (connect and read).
+        :param max_retries: Retries for connection errors and transient HTTP statuses.
+        :param backoff_factor: Exponential backoff factor between retries (seconds).
+        :param pool_maxsize: Number of keep-alive connections kept open to the server.
+        :param max_concurrency: Default number of captions in flight for batch calls.
+        :param cache: Optional CaptionCache consulted before calling the server.
+        :param model_id: Model served at `api_url`; part of the cache key.
         """
         self.api_url = api_url
+        self.cache = cache
+        self.model_id = model_id
+        self.timeout = timeout
+        self.max_concurrency = max(1, max_concurrency)
 
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.RETRY_STATUS_CODES,
+            allowed_methods=frozenset({"POST"}),  # captioning is idempotent, POST is safe to retry
+            raise_on_status=False,  # hand the last response back so it becomes a structured failure
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @instrumented("caption")
     def generate_caption(self, image_base64, prompt="Describe this image."):
         """
         Sends a base64-encoded image to the VLM API for captioning.
         
         :param image_base64: Base64-encoded image string.
         :param prompt: Captioning prompt (default: "Describe this image.").
-        :return: The generated caption or an error message.
+        :return: CaptionResult with either the caption or the failure reason.
+        """
+        if self.cache is None:
+            return self._request_caption(image_base64, prompt)
+
+        key = self.cache.make_key(image_base64, prompt, self.model_id)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return CaptionResult(caption=cached)
+
+        start = time.perf_counter()
+        result = self._request_caption(image_base64, prompt)
+        if result.ok:  # only successful captions are cached, failures are retried next time
+            self.cache.put(key, result.caption, time.perf_counter() - start)
+        return result
+
+    def _request_caption(self, image_base64, prompt):
+        """
+        Performs the HTTP call to the VLM server.
         """
         payload = {"image_base64": image_base64, "prompt": prompt}
 
         try:
-            response = requests.post(self.api_url, json=payload)
+            response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            return CaptionResult(error=f"API request failed: {e}")
 
-            if response.status_code == 200:
-                return response.json()["description"]
-            else:
-                return f"Error: {response.status_code}, {response.text}"
+        if response.status_code != 200:
+            return CaptionResult(error=response.text, status_code=response.status_code)
 
-        except requests.exceptions.RequestException as e:
-            return f"API request failed: {e}"
+        try:
+            description = response.json()["description"]
+        except (ValueError, KeyError, TypeError) as e:
+            return CaptionResult(error=f"Malformed response: {e}", status_code=response.status_code)
+
+        if not isinstance(description, str) or not description.strip():
+            return CaptionResult(error="Empty caption", status_code=response.status_code)
+        return CaptionResult(caption=description.strip(), status_code=response.status_code)
+
+    def generate_captions(self, images_base64: List[str], prompt="Describe this image.", max_concurrency=None):
+        """
+        Captions a batch of images concurrently over the pooled session.
+        :param images_base64: List of base64-encoded images.
+        :param prompt: Captioning prompt sent with every image.
+        :param max_concurrency: Requests in flight (defaults to the service setting).
+        :return: List of CaptionResult in the same order as `images_base64`.
+        """
+        if not images_base64:
+            return []
+
+        workers = min(max_concurrency or self.max_concurrency, len(images_base64))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda img: self.generate_caption(img, prompt=prompt), images_base64))
+
+    async def agenerate_caption(self, image_base64, prompt="Describe this image."):
+        """
+        Async variant of `generate_caption`; runs the pooled request off the event loop.
+        """
+        return await asyncio.to_thread(self.generate_caption, image_base64, prompt)
+
+    async def agenerate_captions(self, images_base64: List[str], prompt="Describe this image.", max_concurrency=None):
+        """
+        Async batch captioning with a bounded number of requests in flight.
+        :return: List of CaptionResult in input order.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+
+        async def _caption(image_base64):
+            async with semaphore:
+                return await self.agenerate_caption(image_base64, prompt)
+
+        return await asyncio.gather(*(_caption(img) for img in images_base64))
+
+    def close(self):
+        """Closes the pooled HTTP connections and the caption cache."""
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 if __name__ == "__main__":
@@ -41,5 +166,5 @@ if __name__ == "__main__":
     vlm_service = VLMService(api_url=api_url)
 
     image_base64 = ""
-    caption = vlm_service.generate_caption(image_base64)
-    print("Generated Caption:", caption)
+    result = vlm_service.generate_caption(image_base64)
+    print("Generated Caption:", result.caption if result.ok else f"<failed: {result.error}>")
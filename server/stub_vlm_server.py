@@ -0,0 +1,79 @@
+"""
+Lightweight stand-in for `vlm_server.py`.
+
+Serves the same `/caption_image` contract without a GPU or model weights, so the
+VLMService client, the parser and the benchmarks can be exercised locally.
+"""
+import argparse
+import hashlib
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubCaptionHandler(BaseHTTPRequestHandler):
+    """
+    Answers caption requests with a deterministic description derived from the image bytes.
+    """
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+    latency = 0.0
+    fail_rate = 0.0
+    api_path = "/caption_image"
+
+    def do_POST(self):
+        if self.path != self.api_path:
+            self._send(404, {"detail": "Not Found"})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+            image_base64 = request["image_base64"]
+        except (ValueError, KeyError):
+            self._send(422, {"detail": "Expected JSON with 'image_base64'"})
+            return
+
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_rate and random.random() < self.fail_rate:
+            self._send(503, {"detail": "Simulated overload"})
+            return
+
+        digest = hashlib.sha256(image_base64.encode("utf-8")).hexdigest()[:12]
+        prompt = request.get("prompt", "Describe this image.")
+        self._send(200, {"description": f"Stub caption {digest} for prompt '{prompt}'"})
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+
+def make_server(host="127.0.0.1", port=8000, latency=0.0, fail_rate=0.0):
+    """
+    Builds (but does not start) a threaded stub server.
+    :param latency: Seconds to sleep per request, to mimic model inference.
+    :param fail_rate: Probability of answering with a transient 503.
+    """
+    handler = type("ConfiguredStubCaptionHandler", (StubCaptionHandler,), {"latency": latency, "fail_rate": fail_rate})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub VLM caption server")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per caption")
+    parser.add_argument("--fail_rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.fail_rate)
+    print(f"Stub VLM server listening on http://{args.host}:{args.port}{StubCaptionHandler.api_path}")
+    server.serve_forever()
@@ -1,59 +1,92 @@
+import argparse
+import os
+
 import litserve as ls
 import torch
 from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor
 from qwen_vl_utils import process_vision_info
 
+DEFAULT_MODEL = "Qwen/Qwen2.5-VL-7B-Instruct-AWQ"
+DEFAULT_PROMPT = "Describe this image"
+
+
 class Qwen25VLAPI(ls.LitAPI):
-    def setup(self, device, model_name="Qwen/Qwen2.5-VL-7B-Instruct-AWQ"):
+    def __init__(self, model_name=DEFAULT_MODEL, max_new_tokens=128):
+        """
+        :param model_name: Hugging Face id of the Qwen2.5-VL checkpoint (a tiny one works on CPU).
+        :param max_new_tokens: Caption length limit.
+        """
+        super().__init__()
+        self.model_name = model_name
+        self.max_new_tokens = max_new_tokens
+
+    def setup(self, device):
         """
         Initializes the Qwen2.5 VL model and processor.
+        Falls back to CPU (float32, SDPA attention) when CUDA is not available.
         """
+        if str(device).startswith("cuda") and not torch.cuda.is_available():
+            device = "cpu"
         self.device = device
-        self.dtype = torch.float16
+        on_gpu = str(device).startswith("cuda")
+        self.dtype = torch.float16 if on_gpu else torch.float32
+
         self.model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
-            model_name,
-            torch_dtype=torch.float16,
-            attn_implementation="flash_attention_2",
+            self.model_name,
+            torch_dtype=self.dtype,
+            attn_implementation="flash_attention_2" if on_gpu else "sdpa",
             device_map=self.device
         )
 
-        self.processor = AutoProcessor.from_pretrained(model_name)
-        self.prompt = "Describe this image"
+        self.processor = AutoProcessor.from_pretrained(self.model_name)
+        # Decoder-only batched generation needs left padding so every prompt ends at the same position
+        self.processor.tokenizer.padding_side = "left"
+        self.prompt = DEFAULT_PROMPT
 
     def decode_request(self, request):
+        return {
+            "image_base64": request["image_base64"],
+            "prompt": request.get("prompt") or self.prompt,  # honour the client's prompt
+        }
 
-        image_base64 = request["image_base64"]
+    def batch(self, inputs):
+        return list(inputs)
 
-        return image_base64
-
-
-    def predict(self, image_base64: str):
+    def predict(self, requests):
         """
-        Takes a base64-encoded image and generates a caption.
+        Takes one or more decoded requests and generates their captions in a single padded batch.
         """
+        single = isinstance(requests, dict)  # max_batch_size=1 skips `batch`
+        if single:
+            requests = [requests]
+
         messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image", "image": f"data:image;base64,{image_base64}"},  # Pass base64 directly
-                    {"type": "text", "text": self.prompt},
-                ],
-            }
+            [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "image", "image": f"data:image;base64,{request['image_base64']}"},  # Pass base64 directly
+                        {"type": "text", "text": request["prompt"]},
+                    ],
+                }
+            ]
+            for request in requests
         ]
 
         # Prepare inputs
-        text = self.processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        texts = [self.processor.apply_chat_template(msg, tokenize=False, add_generation_prompt=True) for msg in messages]
         image_inputs, video_inputs = process_vision_info(messages)
         inputs = self.processor(
-            text=[text],
+            text=texts,
             images=image_inputs,
             videos=video_inputs,
             padding=True,
             return_tensors="pt",
-        ).to("cuda")
+        ).to(self.model.device)
 
         # Generate output
-        generated_ids = self.model.generate(**inputs, max_new_tokens=128) # default is 128
+        with torch.inference_mode():
+            generated_ids = self.model.generate(**inputs, max_new_tokens=self.max_new_tokens)
         generated_ids_trimmed = [
             out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
         ]
@@ -61,12 +94,34 @@ class Qwen25VLAPI(ls.LitAPI):
             generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
         )
 
-        return [output_text[0]]
+        return output_text[0] if single else output_text
+
+    def unbatch(self, output):
+        return list(output)
 
     def encode_response(self, output):
-        return {"description": output[0]}
+        return {"description": output}
+
 
 if __name__ == "__main__":
-    api = Qwen25VLAPI()
-    server = ls.LitServer(api, accelerator="gpu", api_path="/caption_image")
-    server.run(port=8000)
+    parser = argparse.ArgumentParser(description="Qwen2.5-VL captioning server")
+    parser.add_argument("--model", type=str, default=os.environ.get("VLM_MODEL_NAME", DEFAULT_MODEL),
+                        help=f"Model id (default: $VLM_MODEL_NAME or {DEFAULT_MODEL})")
+    parser.add_argument("--accelerator", type=str, choices=["auto", "gpu", "cuda", "cpu"], default="auto",
+                        help="Device to serve on (default: auto, CPU when no GPU is present)")
+    parser.add_argument("--max_batch_size", type=int, default=8, help="Requests decoded together (default: 8)")
+    parser.add_argument("--batch_timeout", type=float, default=0.05,
+                        help="Seconds to wait for a batch to fill (default: 0.05)")
+    parser.add_argument("--max_new_tokens", type=int, default=128, help="Caption length limit (default: 128)")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    api = Qwen25VLAPI(model_name=args.model, max_new_tokens=args.max_new_tokens)
+    server = ls.LitServer(
+        api,
+        accelerator=args.accelerator,
+        max_batch_size=args.max_batch_size,
+        batch_timeout=args.batch_timeout,
+        api_path="/caption_image",
+    )
+    server.run(port=args.port)